@@ -0,0 +1,73 @@
+import collections
+import contextlib
+import os
+import threading
+import time
+
+import config
+import utils
+from tracing import Tracer
+
+
+class MemoryAdmission:
+    """Admits sandbox execs only while the sum of their declared memoryLimit fits the host budget."""
+
+    budget = config.MEMORY_BUDGET
+    if budget is None:
+        budget = int(os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') * config.MEMORY_BUDGET_RATIO)
+
+    in_use = 0
+    cond = threading.Condition()
+    # tickets of waiting execs, admitted in arrival order so large execs are not starved by small ones
+    waiting = collections.deque()
+    seq = 0
+
+    wait_count = 0
+    wait_ns = 0
+    max_wait_ns = 0
+
+    @staticmethod
+    @contextlib.contextmanager
+    def admit(memory):
+        # A single exec above the budget is admitted alone instead of waiting forever
+        memory = min(memory, MemoryAdmission.budget)
+        start = time.monotonic_ns()
+        with MemoryAdmission.cond:
+            MemoryAdmission.seq += 1
+            ticket = MemoryAdmission.seq
+            MemoryAdmission.waiting.append(ticket)
+            waited = False
+            while MemoryAdmission.waiting[0] != ticket or MemoryAdmission.in_use + memory > MemoryAdmission.budget:
+                waited = True
+                MemoryAdmission.cond.wait()
+
+            MemoryAdmission.waiting.popleft()
+            MemoryAdmission.in_use += memory
+            # the next ticket may fit as well
+            MemoryAdmission.cond.notify_all()
+
+        if waited:
+            end = time.monotonic_ns()
+            MemoryAdmission.wait_count += 1
+            MemoryAdmission.wait_ns += end - start
+            MemoryAdmission.max_wait_ns = max(MemoryAdmission.max_wait_ns, end - start)
+            Tracer.record('admission_wait', start, end, **Tracer.current(), memory=memory)
+            utils.logger.debug(f"MemoryAdmission waited {(end - start) // 10 ** 6} ms for {memory} bytes")
+
+        try:
+            yield
+        finally:
+            with MemoryAdmission.cond:
+                MemoryAdmission.in_use -= memory
+                MemoryAdmission.cond.notify_all()
+
+    @staticmethod
+    def stats() -> dict:
+        return {
+            'budget': MemoryAdmission.budget,
+            'in_use': MemoryAdmission.in_use,
+            'waiting': len(MemoryAdmission.waiting),
+            'wait_count': MemoryAdmission.wait_count,
+            'wait_ms': MemoryAdmission.wait_ns // 10 ** 6,
+            'max_wait_ms': MemoryAdmission.max_wait_ns // 10 ** 6,
+        }
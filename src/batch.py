@@ -0,0 +1,75 @@
+import threading
+
+import config
+import utils
+from filestore import FileStoreCollector
+
+
+class ProblemBatch:
+    """Resources shared by the chals of one batch rejudge of a single problem.
+
+    The checker is compiled by the first chal that needs it and the answer files are read once,
+    both stay pinned until the last chal of the batch has finished.
+    """
+
+    # characters of answers cached by all live batches, bounded by BATCH_ANSWER_CACHE_MAX
+    answers_total = 0
+    total_lock = threading.Lock()
+
+    def __init__(self, batch_id, res_path, size):
+        self.batch_id = batch_id
+        self.res_path = res_path
+        self.remaining = size
+        self.lock = threading.Lock()
+
+        self.checker_compiled = False
+        self.checker_res = None
+        self.checker_fileid = None
+
+        self.answers = {}
+        self.answers_size = 0
+
+    def checker(self, chal):
+        with self.lock:
+            if not self.checker_compiled:
+                self.checker_res, self.checker_fileid = chal.comp_checker()
+                if self.checker_fileid is not None:
+                    FileStoreCollector.transfer(chal.chal_id, self.batch_id, self.checker_fileid)
+
+                self.checker_compiled = True
+
+        return self.checker_res, self.checker_fileid
+
+    def answer(self, ans_path) -> str:
+        ans = self.answers.get(ans_path)
+        if ans is not None:
+            return ans
+
+        with open(ans_path, 'r') as ans_file:
+            ans = ans_file.read()
+
+        with self.lock, ProblemBatch.total_lock:
+            if ans_path not in self.answers and ProblemBatch.answers_total + len(ans) <= config.BATCH_ANSWER_CACHE_MAX:
+                self.answers[ans_path] = ans
+                self.answers_size += len(ans)
+                ProblemBatch.answers_total += len(ans)
+
+        return ans
+
+    def release(self):
+        with self.lock:
+            self.remaining -= 1
+            if self.remaining > 0:
+                return
+
+            with ProblemBatch.total_lock:
+                ProblemBatch.answers_total -= self.answers_size
+
+            self.answers.clear()
+            self.answers_size = 0
+
+        if not FileStoreCollector.delete(self.batch_id, self.checker_fileid):
+            utils.logger.warning(f"ProblemBatch {self.batch_id} delete cached checker file {self.checker_fileid} failed.")
+
+        FileStoreCollector.release_chal(self.batch_id)
+        utils.logger.info(f"ProblemBatch {self.batch_id} done")
@@ -0,0 +1,263 @@
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+
+import config
+import executor_server
+import utils
+from filestore import FileStoreCollector
+from server import init_executor
+from stdchal import GoJudgeStatus, StdChal
+
+
+C_SOURCE = r'''
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+static int cmp(const void *a, const void *b) { return *(const int *)a - *(const int *)b; }
+int a[200000];
+int main() {
+    int n;
+    if (scanf("%d", &n) != 1) return 0;
+    for (int i = 0; i < n; i++) scanf("%d", &a[i]);
+    qsort(a, n, sizeof(int), cmp);
+    long long sum = 0;
+    for (int i = 0; i < n; i++) sum += (long long)a[i] * (i + 1);
+    printf("%lld\n", sum);
+    return 0;
+}
+'''
+
+CXX_SOURCE = r'''
+#include <bits/stdc++.h>
+using namespace std;
+int main() {
+    ios::sync_with_stdio(false);
+    cin.tie(nullptr);
+    int n;
+    cin >> n;
+    vector<long long> a(n);
+    map<long long, int> cnt;
+    for (auto &x : a) {
+        cin >> x;
+        cnt[x]++;
+    }
+    sort(a.begin(), a.end());
+    priority_queue<long long, vector<long long>, greater<long long>> pq(a.begin(), a.end());
+    long long ans = 0;
+    while (pq.size() > 1) {
+        long long x = pq.top(); pq.pop();
+        long long y = pq.top(); pq.pop();
+        ans += x + y;
+        pq.push(x + y);
+    }
+    cout << ans << ' ' << cnt.size() << '\n';
+    return 0;
+}
+'''
+
+RUST_SOURCE = r'''
+use std::collections::BTreeMap;
+use std::io::{self, Read, Write};
+fn main() {
+    let mut input = String::new();
+    io::stdin().read_to_string(&mut input).unwrap();
+    let mut it = input.split_ascii_whitespace().map(|x| x.parse::<i64>().unwrap());
+    let n = it.next().unwrap_or(0) as usize;
+    let mut a: Vec<i64> = it.take(n).collect();
+    a.sort_unstable();
+    let mut cnt = BTreeMap::new();
+    for &x in &a {
+        *cnt.entry(x).or_insert(0) += 1;
+    }
+    let out = io::stdout();
+    let mut out = out.lock();
+    writeln!(out, "{} {}", a.iter().sum::<i64>(), cnt.len()).unwrap();
+}
+'''
+
+JAVA_SOURCE = r'''
+import java.io.*;
+import java.util.*;
+public class Main {
+    public static void main(String[] args) throws IOException {
+        BufferedReader br = new BufferedReader(new InputStreamReader(System.in));
+        StringTokenizer st = new StringTokenizer(br.readLine());
+        int n = Integer.parseInt(st.nextToken());
+        long[] a = new long[n];
+        TreeMap<Long, Integer> cnt = new TreeMap<>();
+        st = new StringTokenizer(br.readLine());
+        for (int i = 0; i < n; i++) {
+            a[i] = Long.parseLong(st.nextToken());
+            cnt.merge(a[i], 1, Integer::sum);
+        }
+        Arrays.sort(a);
+        System.out.println(Arrays.stream(a).sum() + " " + cnt.size());
+    }
+}
+'''
+
+PYTHON_SOURCE = r'''
+import sys
+from collections import Counter
+def main():
+    data = sys.stdin.buffer.read().split()
+    n = int(data[0])
+    a = sorted(map(int, data[1:n + 1]))
+    cnt = Counter(a)
+    print(sum(a), len(cnt))
+main()
+'''
+
+MAKEFILE = "all:\n\tg++ -std=gnu++17 -O2 -pipe -static main.cpp -o $(OUT)\n"
+
+# comp_typ -> source of the built-in corpus
+CORPUS = {
+    'gcc': C_SOURCE,
+    'clang': C_SOURCE,
+    'g++': CXX_SOURCE,
+    'clang++': CXX_SOURCE,
+    'makefile': CXX_SOURCE,
+    'rustc': RUST_SOURCE,
+    'java': JAVA_SOURCE,
+    'python3': PYTHON_SOURCE,
+}
+
+C_PROFILES = {
+    'no-pipe': ['-O2', '-static'],
+    'dynamic': ['-O2', '-pipe'],
+    'O1-dynamic': ['-O1', '-pipe'],
+}
+
+# comp_typ -> alternative flag profiles, compared with config.COMPILE_FLAGS ('default')
+PROFILES = {
+    'gcc': C_PROFILES,
+    'clang': C_PROFILES,
+    'g++': C_PROFILES,
+    'clang++': C_PROFILES,
+    'rustc': {
+        'codegen-units=16': ['-O', '-C', 'codegen-units=16'],
+        'opt-level=2': ['-C', 'opt-level=2'],
+        'opt-level=1': ['-C', 'opt-level=1'],
+        'prefer-dynamic': ['-O', '-C', 'prefer-dynamic'],
+        'panic=abort': ['-O', '-C', 'panic=abort'],
+    },
+}
+
+def load_corpus(corpus_dir):
+    # <corpus_dir>/<comp_typ>/<source file>, the built-in corpus if no directory is given
+    corpus = []
+    if corpus_dir is None:
+        for comp_typ, source in CORPUS.items():
+            corpus.append((comp_typ, 'builtin', source))
+
+        return corpus
+
+    for comp_typ in sorted(os.listdir(corpus_dir)):
+        lang_dir = os.path.join(corpus_dir, comp_typ)
+        if comp_typ not in CORPUS or not os.path.isdir(lang_dir):
+            continue
+
+        for file in sorted(os.listdir(lang_dir)):
+            with open(os.path.join(lang_dir, file), 'r') as source_file:
+                corpus.append((comp_typ, file, source_file.read()))
+
+    return corpus
+
+def compile_once(comp_typ, flags, code_path, res_path, run):
+    # Same path as StdChal.prepare, returns (wall ns, cpu ns, sandbox wall ns, peak memory, artifact size) or None on failure
+    chal_id = f"bench-{comp_typ}-{run}"
+    chal = StdChal(chal_id, code_path, comp_typ, 'diff', res_path, [[]], {})
+    if flags is not None:
+        chal.compile_flags = {**config.COMPILE_FLAGS, comp_typ: flags}
+
+    start = time.monotonic_ns()
+    res, fileid, _ = chal.compile()
+    wall = time.monotonic_ns() - start
+
+    if res != GoJudgeStatus.Accepted:
+        utils.logger.warning(f"Bench {comp_typ} {flags} failed with {res}: {chal.results[0]['verdict'][:500]}")
+        return None
+
+    size = executor_server.file_size(fileid)
+    FileStoreCollector.delete(chal_id, fileid)
+    return (wall, *chal.compile_usage, size)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark compile latency, peak memory and artifact size per language and flag profile")
+    parser.add_argument('--corpus', help="directory of <comp_typ>/<source> files, a built-in corpus by default")
+    parser.add_argument('--lang', action='append', help="only benchmark this comp_typ, may be repeated")
+    parser.add_argument('--repeat', type=int, default=5, help="compiles per source and profile")
+    parser.add_argument('--default-only', action='store_true', help="skip the alternative flag profiles")
+    parser.add_argument('--json', help="JSON file the results are written to")
+    args = parser.parse_args()
+
+    if init_executor():
+        utils.logger.error("Failed to init container")
+        return
+
+    rows = []
+    run = 0
+    with tempfile.TemporaryDirectory() as res_path:
+        os.mkdir(os.path.join(res_path, 'make'))
+        with open(os.path.join(res_path, 'make', 'Makefile'), 'w') as makefile:
+            makefile.write(MAKEFILE)
+
+        print(f"{'lang':<10}{'source':<16}{'profile':<18}{'wall ms':>10}{'cpu ms':>10}{'run ms':>10}{'other ms':>10}{'peak MB':>10}{'size KB':>10}")
+        for comp_typ, name, source in load_corpus(args.corpus):
+            if args.lang and comp_typ not in args.lang:
+                continue
+
+            code_path = os.path.join(res_path, f"{comp_typ}.src")
+            with open(code_path, 'w') as code_file:
+                code_file.write(source)
+
+            profiles = [('default', None)]
+            if not args.default_only:
+                profiles.extend(PROFILES.get(comp_typ, {}).items())
+
+            for profile, flags in profiles:
+                samples = []
+                for _ in range(args.repeat):
+                    run += 1
+                    sample = compile_once(comp_typ, flags, code_path, res_path, run)
+                    if sample is None:
+                        break
+
+                    samples.append(sample)
+
+                if len(samples) < args.repeat:
+                    print(f"{comp_typ:<10}{name:<16}{profile:<18}{'failed':>10}")
+                    continue
+
+                wall = statistics.median(sample[0] for sample in samples)
+                cpu = statistics.median(sample[1] for sample in samples)
+                run_time = statistics.median(sample[2] for sample in samples)
+                row = {
+                    'lang': comp_typ,
+                    'source': name,
+                    'profile': profile,
+                    'flags': flags if flags is not None else config.COMPILE_FLAGS.get(comp_typ),
+                    'wall_ms': wall / 10 ** 6,
+                    # cpu time of the compiler and all its children, can exceed run_ms with parallel jobs
+                    'cpu_ms': cpu / 10 ** 6,
+                    # wall time of the compile inside the sandbox
+                    'run_ms': run_time / 10 ** 6,
+                    # sandbox setup, copy in and copying the artifact into the file store
+                    'other_ms': max(0, wall - run_time) / 10 ** 6,
+                    'peak_mb': max(sample[3] for sample in samples) / 2 ** 20,
+                    'size_kb': samples[0][4] / 2 ** 10,
+                }
+                rows.append(row)
+                print(f"{comp_typ:<10}{name:<16}{profile:<18}{row['wall_ms']:>10.1f}{row['cpu_ms']:>10.1f}{row['run_ms']:>10.1f}{row['other_ms']:>10.1f}"
+                      f"{row['peak_mb']:>10.1f}{row['size_kb']:>10.1f}")
+
+    if args.json:
+        with open(args.json, 'w') as json_file:
+            json.dump(rows, json_file, indent=4)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+import argparse
+import statistics
+import time
+
+import executor_server
+import utils
+from server import init_executor
+
+
+# The interactor sends i and expects i + 1 back, the solution answers every number until -1
+INTERACTOR_SOURCE = r'''
+#include <stdio.h>
+#include <stdlib.h>
+int main(int argc, char **argv) {
+    int rounds = atoi(argv[1]), x;
+    for (int i = 0; i < rounds; i++) {
+        printf("%d\n", i);
+        fflush(stdout);
+        if (scanf("%d", &x) != 1 || x != i + 1) return 1;
+    }
+    printf("-1\n");
+    fflush(stdout);
+    return 0;
+}
+'''
+
+SOLUTION_SOURCE = r'''
+#include <stdio.h>
+int main() {
+    int x;
+    while (scanf("%d", &x) == 1 && x != -1) {
+        printf("%d\n", x + 1);
+        fflush(stdout);
+    }
+    return 0;
+}
+'''
+
+def compile_c(source):
+    res = executor_server.exec({
+        "cmd": [{
+            "args": ["/usr/bin/gcc", "-std=gnu11", "-O2", "-pipe", "-static", "a.c", "-o", "a"],
+            "env": ["PATH=/usr/bin:/bin"],
+            "files": [{
+                "content": ""
+            }, {
+                "content": ""
+            }, {
+                "name": "stderr",
+                "max": 102400
+            }],
+            "cpuLimit": 10000000000,
+            "memoryLimit": 536870912,
+            "procLimit": 10,
+            "copyIn": {
+                "a.c": {
+                    "content": source
+                }
+            },
+            "copyOut": ["stderr"],
+            "copyOutCached": ["a"],
+            "copyOutMax": 64000000
+        }]
+    })
+    res = res["results"][0]
+    assert res["status"] == "Accepted", res["files"]["stderr"]
+    return res["fileIds"]["a"]
+
+def interact(solution_fileid, interactor_fileid, rounds, proxy):
+    # Same layout as StdChal.judge_diff_ioredir with stdin/stdout used as the pipe ends
+    start = time.monotonic_ns()
+    res = executor_server.exec({
+        "cmd": [{
+            "args": ["a"],
+            "env": ["PATH=/usr/bin:/bin"],
+            "files": [None, None, {"name": "stderr", "max": 10240}],
+            "cpuLimit": 60 * 10 ** 9,
+            "clockLimit": 120 * 10 ** 9,
+            "memoryLimit": 268435456,
+            "procLimit": 1,
+            "copyIn": {
+                "a": {
+                    "fileId": solution_fileid
+                }
+            },
+        },
+        {
+            "args": ["a", str(rounds)],
+            "env": ["PATH=/usr/bin:/bin"],
+            "files": [None, None, {"name": "stderr", "max": 10240}],
+            "cpuLimit": 60 * 10 ** 9,
+            "clockLimit": 120 * 10 ** 9,
+            "memoryLimit": 268435456,
+            "procLimit": 1,
+            "copyIn": {
+                "a": {
+                    "fileId": interactor_fileid
+                }
+            },
+        }],
+        "pipeMapping": [{
+            "in": {"index": 0, "fd": 1},
+            "out": {"index": 1, "fd": 0},
+            "proxy": proxy,
+        }, {
+            "in": {"index": 1, "fd": 1},
+            "out": {"index": 0, "fd": 0},
+        }],
+    })
+    wall = time.monotonic_ns() - start
+    solution_res, interactor_res = res["results"]
+    assert solution_res["status"] == "Accepted" and interactor_res["status"] == "Accepted", res
+
+    return wall, solution_res["runTime"], interactor_res["runTime"]
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark interaction round trips of ioredir judging in proxy and direct pipe modes")
+    parser.add_argument('--rounds', type=int, default=100000, help="round trips per run")
+    parser.add_argument('--repeat', type=int, default=5, help="runs per mode")
+    args = parser.parse_args()
+
+    if init_executor():
+        utils.logger.error("Failed to init container")
+        return
+
+    solution_fileid = compile_c(SOLUTION_SOURCE)
+    interactor_fileid = compile_c(INTERACTOR_SOURCE)
+
+    print(f"{'mode':<8}{'wall ms':>12}{'solution ms':>14}{'checker ms':>13}{'rtt us':>10}{'round trips/s':>16}")
+    for mode, proxy in [('proxy', True), ('direct', False)]:
+        samples = [interact(solution_fileid, interactor_fileid, args.rounds, proxy) for _ in range(args.repeat)]
+        wall = statistics.median(sample[0] for sample in samples)
+        solution_time = statistics.median(sample[1] for sample in samples)
+        interactor_time = statistics.median(sample[2] for sample in samples)
+        print(f"{mode:<8}{wall / 10 ** 6:>12.1f}{solution_time / 10 ** 6:>14.1f}{interactor_time / 10 ** 6:>13.1f}"
+              f"{wall / args.rounds / 10 ** 3:>10.2f}{args.rounds / (wall / 10 ** 9):>16.0f}")
+
+    executor_server.file_delete(solution_fileid)
+    executor_server.file_delete(interactor_fileid)
+
+if __name__ == "__main__":
+    main()
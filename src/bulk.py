@@ -0,0 +1,128 @@
+import argparse
+import collections
+import json
+import sys
+import threading
+import time
+
+import config
+import utils
+from calibrate import SpeedCalibration
+from filestore import FileStoreCollector
+from server import ChalPriority, Encoder, JudgeDispatcher, init_executor
+
+
+class DirectLoop:
+    # JudgeDispatcher hands results to an IOLoop, offline judging just runs the callback on the chal thread
+    def add_callback(self, callback):
+        callback()
+
+def load_done(output_path):
+    done = set()
+    try:
+        with open(output_path, 'r') as output_file:
+            for line in output_file:
+                try:
+                    res = json.loads(line)
+                    # pretest results are followed by the full result of the chal, failed chals are judged again
+                    if not res.get('pretest', False) and 'error' not in res:
+                        done.add(res['chal_id'])
+                except (ValueError, KeyError):
+                    # the last line may be truncated if the previous run was killed
+                    pass
+    except FileNotFoundError:
+        pass
+
+    return done
+
+def main():
+    parser = argparse.ArgumentParser(description="Judge a JSONL stream of chals offline and write JSONL results")
+    parser.add_argument('-i', '--input', required=True, help="JSONL file of chal objects, '-' for stdin")
+    parser.add_argument('-o', '--output', required=True, help="JSONL file the results are written to")
+    parser.add_argument('--pri', type=int, default=ChalPriority.NORMAL, help="priority of chals that do not carry 'pri'")
+    parser.add_argument('--resume', action='store_true', help="skip chals already in the output file and append to it")
+    parser.add_argument('--inflight', type=int, default=config.JUDGE_TASK_MAXCONCURRENT + config.COMPILE_MAXCONCURRENT + config.JUDGE_QUEUE_TARGET,
+                        help="chals handed to the dispatcher at once")
+    parser.add_argument('--summary', help="JSON file the throughput summary is written to")
+    args = parser.parse_args()
+
+    done = load_done(args.output) if args.resume else set()
+
+    if init_executor():
+        utils.logger.error("Failed to init container")
+        return 1
+
+    if config.SPEED_CALIBRATION:
+        SpeedCalibration.calibrate()
+
+    t = threading.Thread(target=JudgeDispatcher.running, args=(DirectLoop(), ), daemon=True)
+    t.start()
+
+    t = threading.Thread(target=FileStoreCollector.running, daemon=True)
+    t.start()
+
+    inflight = threading.Semaphore(args.inflight)
+    lock = threading.Lock()
+    judged, skipped, failed = 0, len(done), 0
+    status_count = collections.Counter()
+    start = time.monotonic()
+
+    input_file = sys.stdin if args.input == '-' else open(args.input, 'r')
+    with input_file, open(args.output, 'a' if args.resume else 'w') as output_file:
+        def on_result(res):
+            nonlocal judged, failed
+            with lock:
+                output_file.write(json.dumps(res, cls=Encoder) + '\n')
+                output_file.flush()
+                if res.get('pretest', False):
+                    return
+
+                judged += 1
+                if 'error' in res:
+                    failed += 1
+                for result in res['results'] or []:
+                    status_count[result['status']] += 1
+
+                if judged % 100 == 0:
+                    utils.logger.info(f"Bulk judged {judged} chals, {judged / (time.monotonic() - start):.2f} chals/s")
+
+            inflight.release()
+
+        for line in input_file:
+            line = line.strip()
+            if not line:
+                continue
+
+            obj = json.loads(line)
+            if obj['chal_id'] in done or obj['chal_id'] in JudgeDispatcher.chal_set:
+                skipped += 1
+                continue
+
+            obj.setdefault('pri', args.pri)
+            inflight.acquire()
+            while not JudgeDispatcher.emit_chal(obj, on_result):
+                # queue full, only when --inflight is above JUDGE_QUEUE_LIMIT
+                time.sleep(0.1)
+
+        # wait for the chals still running
+        for _ in range(args.inflight):
+            inflight.acquire()
+
+    elapsed = time.monotonic() - start
+    summary = {
+        'judged': judged,
+        'skipped': skipped,
+        'failed': failed,
+        'elapsed': elapsed,
+        'chals_per_sec': judged / elapsed if elapsed > 0 else 0,
+        'status': {str(status): cnt for status, cnt in sorted(status_count.items(), key=lambda item: str(item[0]))},
+    }
+    utils.logger.info(f"Bulk done {json.dumps(summary)}")
+    if args.summary:
+        with open(args.summary, 'w') as summary_file:
+            json.dump(summary, summary_file, indent=4)
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
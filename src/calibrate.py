@@ -0,0 +1,194 @@
+import threading
+import time
+
+import config
+import executor_server
+import utils
+
+
+# Fixed cpu and memory bound workload: a sieve followed by dependent random reads, the checksum keeps it from being optimized out
+WORKLOAD_SOURCE = r'''
+#include <stdio.h>
+#include <stdlib.h>
+#define N 8000000
+static unsigned char composite[N];
+static unsigned int table[1 << 20];
+int main(int argc, char **argv) {
+    int rounds = atoi(argv[1]);
+    unsigned long long sum = 0;
+    for (int r = 0; r < rounds; r++) {
+        for (int i = 2; i < N; i++) composite[i] = 0;
+        for (long long i = 2; i < N; i++) {
+            if (composite[i]) continue;
+            sum += i;
+            for (long long j = i * i; j < N; j += i) composite[j] = 1;
+        }
+        unsigned int x = 12345 + r;
+        for (int i = 0; i < (1 << 20); i++) table[i] = x = x * 1103515245u + 12345u;
+        unsigned int p = 0;
+        for (int i = 0; i < (1 << 22); i++) p = table[(p ^ table[p & ((1 << 20) - 1)]) & ((1 << 20) - 1)] + i;
+        sum += p;
+    }
+    printf("%llu\n", sum);
+    return 0;
+}
+'''
+
+class SpeedCalibration:
+    """Speed of this node relative to the reference machine, from the sandbox cpu time of a fixed workload.
+
+    factor < 1 means the node is slower than the reference. With SPEED_SCALE_LIMITS, time limits are
+    divided by the factor and reported times multiplied by it, so verdicts are in reference machine time.
+    """
+
+    factor = 1.0
+    measured = None
+    last_check = None
+    checks = 0
+    lock = threading.Lock()
+
+    @staticmethod
+    def compile_workload():
+        res = executor_server.exec({
+            "cmd": [{
+                "args": ["/usr/bin/gcc", "-std=gnu11", "-O2", "-pipe", "-static", "a.c", "-o", "a"],
+                "env": ["PATH=/usr/bin:/bin"],
+                "files": [{
+                    "content": ""
+                }, {
+                    "content": ""
+                }, {
+                    "name": "stderr",
+                    "max": 102400
+                }],
+                "cpuLimit": 10000000000,
+                "memoryLimit": 536870912,
+                "procLimit": 10,
+                "copyIn": {
+                    "a.c": {
+                        "content": WORKLOAD_SOURCE
+                    }
+                },
+                "copyOut": ["stderr"],
+                "copyOutCached": ["a"],
+                "copyOutMax": 64000000
+            }]
+        }, pin='compile')
+        res = res["results"][0]
+        if res["status"] != "Accepted":
+            utils.logger.error(f"SpeedCalibration failed to compile the workload: {res['files'].get('stderr', '')}")
+            return None
+
+        return res["fileIds"]["a"]
+
+    @staticmethod
+    def run_workload(fileid):
+        res = executor_server.exec({
+            "cmd": [{
+                "args": ["a", str(config.SPEED_WORKLOAD_ROUNDS)],
+                "env": ["PATH=/usr/bin:/bin"],
+                "files": [{
+                    "content": ""
+                }, {
+                    "name": "stdout",
+                    "max": 1024
+                }, {
+                    "name": "stderr",
+                    "max": 1024
+                }],
+                "cpuLimit": 60 * 10 ** 9,
+                "memoryLimit": 268435456,
+                "procLimit": 1,
+                "copyIn": {
+                    "a": {
+                        "fileId": fileid
+                    }
+                },
+            }]
+        }, pin='run')
+        res = res["results"][0]
+        if res["status"] != "Accepted":
+            utils.logger.error(f"SpeedCalibration workload ended with {res['status']}")
+            return None
+
+        # cgroup cpu time, runTime is wall clock and grows with the load of the node
+        return res["time"]
+
+    @staticmethod
+    def measure():
+        # Minimum cpu time of SPEED_SAMPLES runs, None if the workload could not run
+        fileid = SpeedCalibration.compile_workload()
+        if fileid is None:
+            return None
+
+        try:
+            samples = [SpeedCalibration.run_workload(fileid) for _ in range(config.SPEED_SAMPLES)]
+        finally:
+            executor_server.file_delete(fileid)
+
+        if None in samples:
+            return None
+
+        return min(samples)
+
+    @staticmethod
+    def calibrate():
+        measured = SpeedCalibration.measure()
+        if measured is None:
+            utils.logger.warning(f"SpeedCalibration failed, keeping factor {SpeedCalibration.factor:.3f}")
+            return
+
+        factor = config.SPEED_REFERENCE_NS / measured
+        factor = min(max(factor, config.SPEED_FACTOR_MIN), config.SPEED_FACTOR_MAX)
+        with SpeedCalibration.lock:
+            previous = SpeedCalibration.factor
+            SpeedCalibration.factor = factor
+            SpeedCalibration.measured = measured
+            SpeedCalibration.last_check = time.time()
+            SpeedCalibration.checks += 1
+
+        if SpeedCalibration.checks == 1 or abs(factor - previous) > previous * 0.05:
+            utils.logger.info(f"SpeedCalibration workload took {measured / 10 ** 6:.1f} ms cpu, speed factor {factor:.3f}")
+
+    @staticmethod
+    def limit_factor() -> float:
+        # Factor applied to the limits and times of new chals, 1 unless SPEED_SCALE_LIMITS
+        if not config.SPEED_SCALE_LIMITS:
+            return 1.0
+
+        return SpeedCalibration.factor
+
+    @staticmethod
+    def running(busy):
+        # busy() is True while chals are judged, a re-check then waits for the next interval
+        # so memory bandwidth and cache contention of other runs do not skew the factor
+        event = threading.Event()
+        while not event.wait(config.SPEED_RECHECK_INTERVAL):
+            if busy():
+                utils.logger.debug("SpeedCalibration re-check skipped, node busy")
+                continue
+
+            try:
+                SpeedCalibration.calibrate()
+            except Exception as e:
+                utils.logger.error(f"SpeedCalibration failed: {e}")
+
+    @staticmethod
+    def stats() -> dict:
+        return {
+            'factor': SpeedCalibration.factor,
+            'measured_ns': SpeedCalibration.measured,
+            'reference_ns': config.SPEED_REFERENCE_NS,
+            'scale_limits': config.SPEED_SCALE_LIMITS,
+            'last_check': SpeedCalibration.last_check,
+            'checks': SpeedCalibration.checks,
+        }
+
+if __name__ == "__main__":
+    # Run on the reference machine to get SPEED_REFERENCE_NS
+    from server import init_executor
+
+    if init_executor():
+        utils.logger.error("Failed to init container")
+    else:
+        print(SpeedCalibration.measure())
@@ -2,3 +2,121 @@ import logging
 
 JUDGE_TASK_MAXCONCURRENT = 4
 LOGGER_LEVEL = logging.DEBUG
+
+# Interval (seconds) between sweeps of orphaned files in the go-judge file store
+FILESTORE_GC_INTERVAL = 60
+
+# Per-chal trace spans kept in memory, exported from /trace as Chrome trace JSON
+TRACE_ENABLED = True
+TRACE_BUFFER_SIZE = 65536
+
+# Compile and run a trivial program for every language before reporting ready on /ready
+WARMUP_ENABLED = True
+# res_path of problems whose testdata and checker are preloaded into the page cache on startup
+WARMUP_PROBLEMS = []
+
+# Upper bound (characters) of answer files kept in memory by all running batch rejudges together,
+# this memory is outside the sandbox budget of MemoryAdmission
+BATCH_ANSWER_CACHE_MAX = 256 * 1024 * 1024
+
+# Run the CMS checker of test N while the user program runs on test N + 1
+CMS_PIPELINE = True
+
+# Host memory (bytes) shared by the declared memoryLimit of all in-flight execs,
+# None means MEMORY_BUDGET_RATIO of the physical memory
+MEMORY_BUDGET = None
+MEMORY_BUDGET_RATIO = 0.8
+
+# Sandbox execs run in parallel by go-judge
+JUDGE_PARALLELISM = 4
+# Pin every user program run to a dedicated core (needs the cgroup cpuset controller),
+# go-judge parallelism and the chals running tests (instead of JUDGE_TASK_MAXCONCURRENT)
+# then follow the number of run cores. Checkers and interactors get cores of their own so
+# compiles never slow them down. None picks one judge, one compile and one check core from
+# the start of the available cores and gives the rest to runs.
+CPU_PINNING = False
+JUDGE_CPUS = None
+COMPILE_CPUS = None
+CHECK_CPUS = None
+RUN_CPUS = None
+
+# Re-run TLE runs and runs within REMEASURE_MARGIN of the time limit of diff problems up to
+# REMEASURE_SAMPLES times in total and judge by the 'min' or 'median' sample,
+# at most REMEASURE_BUDGET extra runs per chal. 1 sample disables it.
+REMEASURE_SAMPLES = 1
+REMEASURE_MARGIN = 0.05
+REMEASURE_POLICY = 'min'
+REMEASURE_BUDGET = 5
+
+# Chals compiling at once, independent of the JUDGE_TASK_MAXCONCURRENT chals running tests
+COMPILE_MAXCONCURRENT = 2
+
+# Chal results kept for identical resubmissions and rejudges, 0 disables it.
+# The backend can force a fresh run with "no_cache": true.
+RESULT_CACHE_SIZE = 4096
+
+# Queued chals beyond which new chals are rejected, and the queue depth the credits
+# advertised to backends (websocket message {"type": "capacity"}) aim for
+JUDGE_QUEUE_LIMIT = 1000
+JUDGE_QUEUE_TARGET = 8
+
+# Warm the testdata and checker of the next PREFETCH_LOOKAHEAD queued chals into the page cache
+# every PREFETCH_INTERVAL seconds, reading at most PREFETCH_BUDGET bytes per round. 0 disables it.
+PREFETCH_LOOKAHEAD = 8
+PREFETCH_INTERVAL = 1
+PREFETCH_BUDGET = 512 * 1024 * 1024
+
+# Within a priority, start chals by arrival time + expected cost (tests x timelimit + compile time)
+# instead of FIFO. The cost is capped at SJF_AGING_BOUND seconds so expensive chals are not starved.
+SJF_ENABLED = False
+SJF_AGING_BOUND = 60
+SJF_COMPILE_EMA = 0.2
+
+# stdout cap of diff runs: answer size x OUTPUT_LIMIT_FACTOR + OUTPUT_LIMIT_SLACK bytes,
+# overridden per problem by metadata "output_limit", never above OUTPUT_LIMIT_MAX
+OUTPUT_LIMIT_FACTOR = 2
+OUTPUT_LIMIT_SLACK = 1024 * 1024
+OUTPUT_LIMIT_MAX = 268435456
+
+# Wall clock limit, as a multiple of cpuLimit, of both sides of an interactive run using metadata "redir_pipe": "direct"
+IOREDIR_CLOCK_FACTOR = 3
+
+# Priority the deferred groups of a pretest mode chal are queued at (never higher than the chal's own)
+PRETEST_DEFERRED_PRI = 2
+
+# Fair sharing of each priority between backend connections, by the name given in /judge?client=<name>.
+# A client with weight 2 starts twice as many chals as a client with weight 1 while both have chals queued.
+# The quota caps the chals of a client running at once, None for no cap.
+CLIENT_WEIGHTS = {}
+CLIENT_DEFAULT_WEIGHT = 1
+CLIENT_QUOTAS = {}
+CLIENT_DEFAULT_QUOTA = None
+
+# Sampling profiler, toggled by SIGUSR2 or POST/DELETE /profile. Stacks of all threads are sampled
+# every PROFILE_INTERVAL seconds for at most PROFILE_MAX_DURATION seconds and written to PROFILE_DIR.
+PROFILE_INTERVAL = 0.01
+PROFILE_MAX_DURATION = 60
+PROFILE_DIR = '/tmp'
+
+# Optimization and linking flags of the compile command of each language.
+# bench_compile.py compares alternatives to these.
+COMPILE_FLAGS = {
+    'g++': ['-O2', '-pipe', '-static'],
+    'clang++': ['-O2', '-pipe', '-static'],
+    'gcc': ['-O2', '-pipe', '-static'],
+    'clang': ['-O2', '-pipe', '-static'],
+    'rustc': ['-O'],
+}
+
+# Node speed calibration: the sandbox cpu time of a fixed workload (SPEED_WORKLOAD_ROUNDS rounds, best of
+# SPEED_SAMPLES runs) is compared with SPEED_REFERENCE_NS, its time on the reference machine
+# (get it by running calibrate.py there). Re-checked every SPEED_RECHECK_INTERVAL seconds.
+# With SPEED_SCALE_LIMITS, time limits and reported times are scaled to the reference machine.
+SPEED_CALIBRATION = True
+SPEED_SCALE_LIMITS = False
+SPEED_REFERENCE_NS = 400 * 10 ** 6
+SPEED_WORKLOAD_ROUNDS = 1
+SPEED_SAMPLES = 5
+SPEED_RECHECK_INTERVAL = 600
+SPEED_FACTOR_MIN = 0.25
+SPEED_FACTOR_MAX = 4
@@ -0,0 +1,82 @@
+import contextlib
+import os
+from queue import Queue
+
+import config
+import utils
+
+
+def _cpulist(cpus) -> str:
+    return ','.join(str(cpu) for cpu in sorted(cpus))
+
+class CpuPinning:
+    """Dedicated cores for user program runs, shared cores for compiles, shared cores for checkers
+    and interactors, and the rest for the judge."""
+
+    judge_cpus = []
+    compile_cpus = []
+    check_cpus = []
+    run_cpus = []
+    free_run_cpus = Queue()
+
+    @staticmethod
+    def init():
+        available = sorted(os.sched_getaffinity(0))
+        judge_cpus = config.JUDGE_CPUS if config.JUDGE_CPUS is not None else available[:1]
+        compile_cpus = config.COMPILE_CPUS if config.COMPILE_CPUS is not None else available[1:2]
+        check_cpus = config.CHECK_CPUS if config.CHECK_CPUS is not None else available[2:3]
+        run_cpus = config.RUN_CPUS
+        if run_cpus is None:
+            run_cpus = [cpu for cpu in available if cpu not in judge_cpus and cpu not in compile_cpus and cpu not in check_cpus]
+
+        if not run_cpus or not compile_cpus or not check_cpus:
+            utils.logger.warning(f"CpuPinning needs at least 4 cores, {len(available)} available, pinning disabled")
+            return False
+
+        CpuPinning.judge_cpus = judge_cpus
+        CpuPinning.compile_cpus = compile_cpus
+        CpuPinning.check_cpus = check_cpus
+        CpuPinning.run_cpus = run_cpus
+        for cpu in run_cpus:
+            CpuPinning.free_run_cpus.put(cpu)
+
+        # Threads started afterwards (tornado, dispatcher, go-judge) inherit this mask,
+        # sandboxed processes are moved to their own cpuset by go-judge
+        os.sched_setaffinity(0, judge_cpus)
+        utils.logger.info(f"CpuPinning judge {_cpulist(judge_cpus)} compile {_cpulist(compile_cpus)} check {_cpulist(check_cpus)} run {_cpulist(run_cpus)}")
+        return True
+
+    @staticmethod
+    def parallelism() -> int:
+        if not CpuPinning.run_cpus:
+            return config.JUDGE_PARALLELISM
+
+        # Workers for every run core, the compile stage and one checker per run, so a run holding
+        # its core never waits behind a compile or a checker for a go-judge worker
+        return 2 * len(CpuPinning.run_cpus) + config.COMPILE_MAXCONCURRENT
+
+    @staticmethod
+    @contextlib.contextmanager
+    def pin(cmd, kind):
+        if not CpuPinning.run_cpus or kind is None:
+            yield
+            return
+
+        if kind in ['compile', 'check']:
+            cpus = CpuPinning.compile_cpus if kind == 'compile' else CpuPinning.check_cpus
+            for c in cmd['cmd']:
+                c['cpuSetLimit'] = _cpulist(cpus)
+
+            yield
+            return
+
+        # kind == 'run': the user program gets a core of its own, interactive checkers share the check cores
+        cpu = CpuPinning.free_run_cpus.get()
+        try:
+            cmd['cmd'][0]['cpuSetLimit'] = str(cpu)
+            for c in cmd['cmd'][1:]:
+                c['cpuSetLimit'] = _cpulist(CpuPinning.check_cpus)
+
+            yield
+        finally:
+            CpuPinning.free_run_cpus.put(cpu)
@@ -1,6 +1,10 @@
 import cffi
 import json
 
+from admission import MemoryAdmission
+from cpupin import CpuPinning
+from tracing import Tracer
+
 FFI = None
 FFILIB = None
 
@@ -69,11 +73,47 @@ def init_container(conf: dict):
 
     return FFILIB.Init(json.dumps(conf).encode('utf-8'))
 
-def exec(cmd: dict) -> dict:
+def exec(cmd: dict, pin=None) -> dict:
+    # pin is 'run' for user programs, 'compile' for compilers, 'check' for checkers, see CpuPinning
+    assert FFILIB is not None
+    memory = sum(c.get('memoryLimit', 0) for c in cmd['cmd'])
+    # the run core is taken first, so a run waiting for a core does not hold memory compiles could use
+    with Tracer.span('exec', memory=memory) as span, CpuPinning.pin(cmd, pin), MemoryAdmission.admit(memory):
+        payload = json.dumps(cmd).encode('utf-8')
+        char_pointer = FFILIB.Exec(payload)
+        res_payload = FFI.string(char_pointer)
+        FFILIB.free(char_pointer)
+        span['req_bytes'] = len(payload)
+        span['res_bytes'] = len(res_payload)
+
+    return json.loads(res_payload.decode('utf-8'))
+
+def file_list() -> dict:
     assert FFILIB is not None
-    char_pointer = FFILIB.Exec(json.dumps(cmd).encode('utf-8'))
-    res = json.loads(FFI.string(char_pointer).decode('utf-8'))
-    FFILIB.free(char_pointer)
+
+    ids = FFI.new('char***')
+    names = FFI.new('char***')
+    cnt = FFILIB.FileList(ids, names)
+
+    files = {}
+    for i in range(cnt):
+        files[FFI.string(ids[0][i]).decode('utf-8')] = FFI.string(names[0][i]).decode('utf-8')
+        FFILIB.free(ids[0][i])
+        FFILIB.free(names[0][i])
+
+    if cnt > 0:
+        FFILIB.free(ids[0])
+        FFILIB.free(names[0])
+
+    return files
+
+def file_size(fileid: str) -> int:
+    assert FFILIB is not None
+
+    out = FFI.new('char**')
+    res = FFILIB.FileGet(fileid.encode('utf-8'), out)
+    if res >= 0:
+        FFILIB.free(out[0])
 
     return res
 
@@ -0,0 +1,129 @@
+import heapq
+import threading
+import time
+
+import config
+
+
+class ClientShare:
+    def __init__(self, name):
+        self.name = name
+        self.weight = config.CLIENT_WEIGHTS.get(name, config.CLIENT_DEFAULT_WEIGHT)
+        self.quota = config.CLIENT_QUOTAS.get(name, config.CLIENT_DEFAULT_QUOTA)
+        # virtual time, advanced by 1 / weight for every chal started
+        self.vtime = 0.0
+        self.queued = 0
+        self.running = 0
+        self.started = 0
+        self.done = 0
+        self.wait_total = 0
+        self.wait_max = 0
+        self.since = time.monotonic()
+
+class FairShare:
+    """Start-time fair queuing of the chals of a priority between the connections that sent them.
+
+    Within one connection chals keep the queue order (arrival time or SJF key).
+    """
+
+    clients = {}
+    # clients whose connection is gone, dropped once nothing of theirs is queued or running
+    closing = set()
+    lock = threading.Lock()
+
+    @staticmethod
+    def client(name) -> ClientShare:
+        if name not in FairShare.clients:
+            FairShare.clients[name] = ClientShare(name)
+
+        return FairShare.clients[name]
+
+    @staticmethod
+    def on_emit(name):
+        with FairShare.lock:
+            share = FairShare.client(name)
+            if share.queued == 0 and share.running == 0:
+                # an idle client rejoins at the current virtual time instead of spending credit saved while idle
+                active = [client.vtime for client in FairShare.clients.values() if client.queued > 0 or client.running > 0]
+                if active:
+                    share.vtime = max(share.vtime, min(active))
+
+            share.queued += 1
+
+    @staticmethod
+    def pick(queue):
+        # Removes and returns the next chal of the queue, None if the queue is empty or every client is at its quota
+        with FairShare.lock, queue.mutex:
+            heads = {}
+            for chal_obj in queue.queue:
+                if chal_obj.client not in heads or chal_obj < heads[chal_obj.client]:
+                    heads[chal_obj.client] = chal_obj
+
+            best = None
+            for name, chal_obj in heads.items():
+                share = FairShare.client(name)
+                if share.quota is not None and share.running >= share.quota:
+                    continue
+
+                if best is None or (share.vtime, chal_obj) < (FairShare.clients[best.client].vtime, best):
+                    best = chal_obj
+
+            if best is None:
+                return None
+
+            queue.queue.remove(best)
+            heapq.heapify(queue.queue)
+
+            share = FairShare.clients[best.client]
+            share.vtime += 1 / share.weight
+            share.queued -= 1
+            share.running += 1
+            share.started += 1
+            wait = time.monotonic_ns() - best.emit_time
+            share.wait_total += wait
+            share.wait_max = max(share.wait_max, wait)
+
+        return best
+
+    @staticmethod
+    def on_done(name, finished=True):
+        # finished is False for chals whose deferred groups are queued again
+        with FairShare.lock:
+            share = FairShare.client(name)
+            share.running -= 1
+            if finished:
+                share.done += 1
+
+            FairShare._drop_if_idle(name)
+
+    @staticmethod
+    def close(name):
+        with FairShare.lock:
+            FairShare.closing.add(name)
+            FairShare._drop_if_idle(name)
+
+    @staticmethod
+    def _drop_if_idle(name):
+        share = FairShare.clients.get(name)
+        if name in FairShare.closing and (share is None or (share.queued == 0 and share.running == 0)):
+            FairShare.closing.discard(name)
+            FairShare.clients.pop(name, None)
+
+    @staticmethod
+    def stats() -> dict:
+        now = time.monotonic()
+        with FairShare.lock:
+            return {
+                name: {
+                    'weight': share.weight,
+                    'quota': share.quota,
+                    'queued': share.queued,
+                    'running': share.running,
+                    'started': share.started,
+                    'done': share.done,
+                    'chals_per_sec': share.done / (now - share.since) if now > share.since else 0,
+                    'queue_wait_avg': share.wait_total / share.started / 10 ** 9 if share.started > 0 else 0,
+                    'queue_wait_max': share.wait_max / 10 ** 9,
+                }
+                for name, share in FairShare.clients.items()
+            }
@@ -0,0 +1,127 @@
+import threading
+
+import config
+import executor_server
+import utils
+
+
+class FileStoreCollector:
+    # chal_id -> set of cached fileIds created by that chal
+    owned = {}
+    # fileIds that were orphaned on the previous sweep, deleted if still orphaned on the next one
+    suspects = set()
+    sizes = {}
+    lock = threading.Lock()
+
+    store_size = 0
+    store_count = 0
+    reclaimed_bytes = 0
+    reclaimed_count = 0
+
+    @staticmethod
+    def track(chal_id, fileid):
+        if fileid is None:
+            return
+
+        with FileStoreCollector.lock:
+            FileStoreCollector.owned.setdefault(chal_id, set()).add(fileid)
+
+    @staticmethod
+    def transfer(from_id, to_id, fileid):
+        with FileStoreCollector.lock:
+            if from_id in FileStoreCollector.owned:
+                FileStoreCollector.owned[from_id].discard(fileid)
+
+            FileStoreCollector.owned.setdefault(to_id, set()).add(fileid)
+
+    @staticmethod
+    def delete(chal_id, fileid) -> bool:
+        if fileid is None:
+            return True
+
+        with FileStoreCollector.lock:
+            if chal_id in FileStoreCollector.owned:
+                FileStoreCollector.owned[chal_id].discard(fileid)
+
+        return executor_server.file_delete(fileid) != 0
+
+    @staticmethod
+    def release_chal(chal_id):
+        with FileStoreCollector.lock:
+            fileids = FileStoreCollector.owned.pop(chal_id, set())
+
+        for fileid in fileids:
+            utils.logger.warning(f"StdChal {chal_id} leaked cached file {fileid}, deleting")
+            size = FileStoreCollector._size(fileid)
+            if executor_server.file_delete(fileid) != 0:
+                FileStoreCollector._reclaim(fileid, size)
+
+    @staticmethod
+    def sweep():
+        files = executor_server.file_list()
+
+        with FileStoreCollector.lock:
+            live = set()
+            for fileids in FileStoreCollector.owned.values():
+                live |= fileids
+
+        # A fileId is created by go-judge before StdChal gets the chance to track it,
+        # so only files that stay orphaned over two sweeps are deleted.
+        orphans = set(fileid for fileid in files if fileid not in live)
+        expired = orphans & FileStoreCollector.suspects
+        FileStoreCollector.suspects = orphans - expired
+
+        for fileid in expired:
+            size = FileStoreCollector._size(fileid)
+            if executor_server.file_delete(fileid) != 0:
+                utils.logger.info(f"FileStore deleted orphaned file {fileid} ({files[fileid]}) {size} bytes")
+                FileStoreCollector._reclaim(fileid, size)
+
+        store_size = 0
+        store_count = 0
+        for fileid in files:
+            if fileid in expired:
+                continue
+
+            store_size += FileStoreCollector._size(fileid)
+            store_count += 1
+
+        for fileid in list(FileStoreCollector.sizes):
+            if fileid not in files:
+                FileStoreCollector.sizes.pop(fileid)
+
+        FileStoreCollector.store_size = store_size
+        FileStoreCollector.store_count = store_count
+        utils.logger.info(f"FileStore {store_count} files {store_size} bytes, reclaimed {FileStoreCollector.reclaimed_count} files {FileStoreCollector.reclaimed_bytes} bytes")
+
+    @staticmethod
+    def stats() -> dict:
+        return {
+            'store_size': FileStoreCollector.store_size,
+            'store_count': FileStoreCollector.store_count,
+            'reclaimed_bytes': FileStoreCollector.reclaimed_bytes,
+            'reclaimed_count': FileStoreCollector.reclaimed_count,
+        }
+
+    @staticmethod
+    def running():
+        event = threading.Event()
+        while not event.wait(config.FILESTORE_GC_INTERVAL):
+            try:
+                FileStoreCollector.sweep()
+            except Exception as e:
+                utils.logger.error(f"FileStore sweep failed: {e}")
+
+    @staticmethod
+    def _size(fileid) -> int:
+        # Cached files are immutable, so the size only has to be fetched once
+        if fileid not in FileStoreCollector.sizes:
+            FileStoreCollector.sizes[fileid] = max(executor_server.file_size(fileid), 0)
+
+        return FileStoreCollector.sizes[fileid]
+
+    @staticmethod
+    def _reclaim(fileid, size):
+        FileStoreCollector.sizes.pop(fileid, None)
+        FileStoreCollector.reclaimed_bytes += size
+        FileStoreCollector.reclaimed_count += 1
@@ -0,0 +1,103 @@
+import collections
+import copy
+import hashlib
+import json
+import os
+import threading
+
+import config
+import utils
+from stdchal import Status
+
+
+class ResultCache:
+    """Bounded LRU of chal results keyed by source, language, judge type, testdata manifest and limits.
+
+    Identical chals arriving while one of them is judged are parked on it and get its result instead of judging again.
+    """
+
+    cache = collections.OrderedDict()
+    # key -> callbacks of the parked followers of the chal being judged
+    inflight = {}
+    lock = threading.Lock()
+
+    hits = 0
+    misses = 0
+    coalesced = 0
+
+    # Results containing these may be caused by the judge itself, never reuse them
+    UNCACHEABLE_STATUS = [Status.InternalError, Status.SpecialJudgeError]
+
+    @staticmethod
+    def manifest(res_path) -> str:
+        h = hashlib.sha256()
+        for sub in ['testdata', 'check', 'make']:
+            dir_path = os.path.join(res_path, sub)
+            if not os.path.isdir(dir_path):
+                continue
+
+            for entry in sorted(os.scandir(dir_path), key=lambda entry: entry.name):
+                st = entry.stat()
+                h.update(f"{sub}/{entry.name}:{st.st_size}:{st.st_mtime_ns}\n".encode('utf-8'))
+
+        return h.hexdigest()
+
+    @staticmethod
+    def key(obj):
+        try:
+            with open(obj['code_path'], 'rb') as code_file:
+                source_digest = hashlib.sha256(code_file.read()).hexdigest()
+
+            manifest = ResultCache.manifest(obj['res_path'])
+        except OSError as e:
+            utils.logger.warning(f"ResultCache failed to compute key of chal {obj['chal_id']}: {e}")
+            return None
+
+        payload = json.dumps([source_digest, obj['comp_type'], obj['check_type'], manifest, obj['test'], obj['metadata'], obj.get('mode')], sort_keys=True)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def acquire(key, follower):
+        # Returns (results, leader). With neither results nor leader the caller is parked:
+        # follower is called with the leader's results, or None if the chal has to be judged again.
+        with ResultCache.lock:
+            if key in ResultCache.cache:
+                ResultCache.cache.move_to_end(key)
+                ResultCache.hits += 1
+                return copy.deepcopy(ResultCache.cache[key]), False
+
+            if key not in ResultCache.inflight:
+                ResultCache.inflight[key] = []
+                ResultCache.misses += 1
+                return None, True
+
+            ResultCache.inflight[key].append(follower)
+            ResultCache.coalesced += 1
+
+        return None, False
+
+    @staticmethod
+    def complete(key, results):
+        with ResultCache.lock:
+            cacheable = results is not None and all(res['status'] not in ResultCache.UNCACHEABLE_STATUS for res in results)
+            if cacheable:
+                ResultCache.cache[key] = copy.deepcopy(results)
+                while len(ResultCache.cache) > config.RESULT_CACHE_SIZE:
+                    ResultCache.cache.popitem(last=False)
+
+            followers = ResultCache.inflight.pop(key)
+
+        for follower in followers:
+            try:
+                follower(copy.deepcopy(results) if cacheable else None)
+            except Exception as e:
+                utils.logger.error(f"ResultCache follower of {key} failed: {e}")
+
+    @staticmethod
+    def stats() -> dict:
+        return {
+            'size': len(ResultCache.cache),
+            'hits': ResultCache.hits,
+            'misses': ResultCache.misses,
+            'coalesced': ResultCache.coalesced,
+        }
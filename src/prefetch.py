@@ -0,0 +1,107 @@
+import os
+import threading
+
+import config
+import utils
+
+
+class Prefetcher:
+    """Pulls the testdata and checker of the next queued chals into the page cache."""
+
+    # chal_id of queued chals whose files have been prefetched
+    prefetched = set()
+    # chal_id -> number of its files already prefetched, for chals larger than the budget left in a round
+    progress = {}
+    lock = threading.Lock()
+
+    hits = 0
+    misses = 0
+    prefetched_bytes = 0
+
+    @staticmethod
+    def chal_files(chal):
+        res_path = chal['res_path']
+        files = []
+        for test in chal['test']:
+            for data_id in test['metadata']['data']:
+                files.append(f"{res_path}/testdata/{data_id}.in")
+                files.append(f"{res_path}/testdata/{data_id}.out")
+
+        for sub in ['check', 'make']:
+            dir_path = os.path.join(res_path, sub)
+            if os.path.isdir(dir_path):
+                files.extend(os.path.join(dir_path, file) for file in os.listdir(dir_path))
+
+        return files
+
+    @staticmethod
+    def lookahead(chal_queues):
+        # The next PREFETCH_LOOKAHEAD chals, in the order the dispatcher will start them
+        chals = []
+        for queue in chal_queues:
+            with queue.mutex:
+                chals.extend(chal_obj.chal for chal_obj in sorted(queue.queue)[:config.PREFETCH_LOOKAHEAD - len(chals)])
+
+            if len(chals) >= config.PREFETCH_LOOKAHEAD:
+                break
+
+        return chals
+
+    @staticmethod
+    def prefetch(chal_queues):
+        budget = config.PREFETCH_BUDGET
+        warmed_files = set()
+        for chal in Prefetcher.lookahead(chal_queues):
+            if chal['chal_id'] in Prefetcher.prefetched:
+                continue
+
+            files = Prefetcher.chal_files(chal)
+            done = Prefetcher.progress.get(chal['chal_id'], 0)
+            while done < len(files) and budget > 0:
+                path = files[done]
+                done += 1
+                if path in warmed_files:
+                    continue
+
+                size = utils.fadvise_willneed(path)
+                warmed_files.add(path)
+                budget -= size
+                Prefetcher.prefetched_bytes += size
+
+            with Prefetcher.lock:
+                if done < len(files):
+                    # the next round continues from here instead of warming the same files again
+                    Prefetcher.progress[chal['chal_id']] = done
+                    break
+
+                Prefetcher.progress.pop(chal['chal_id'], None)
+                Prefetcher.prefetched.add(chal['chal_id'])
+
+    @staticmethod
+    def on_start(chal_id):
+        with Prefetcher.lock:
+            Prefetcher.progress.pop(chal_id, None)
+            if chal_id in Prefetcher.prefetched:
+                Prefetcher.prefetched.remove(chal_id)
+                Prefetcher.hits += 1
+            else:
+                Prefetcher.misses += 1
+
+    @staticmethod
+    def running(chal_queues):
+        event = threading.Event()
+        while not event.wait(config.PREFETCH_INTERVAL):
+            try:
+                Prefetcher.prefetch(chal_queues)
+            except Exception as e:
+                utils.logger.error(f"Prefetcher failed: {e}")
+
+    @staticmethod
+    def stats() -> dict:
+        total = Prefetcher.hits + Prefetcher.misses
+        return {
+            'hits': Prefetcher.hits,
+            'misses': Prefetcher.misses,
+            'hit_rate': Prefetcher.hits / total if total > 0 else 0,
+            'prefetched_bytes': Prefetcher.prefetched_bytes,
+        }
@@ -0,0 +1,114 @@
+import collections
+import os
+import sys
+import threading
+import time
+
+import config
+import utils
+
+
+class SamplingProfiler:
+    """Samples the Python stacks of all threads and writes them as collapsed stacks for flamegraph.pl or speedscope."""
+
+    thread = None
+    stop_event = threading.Event()
+    lock = threading.Lock()
+
+    # path of the last profile written
+    last_path = None
+
+    # Leaf frames of these files mean the thread is blocked, not using CPU
+    IDLE_FILES = ['threading.py', 'selectors.py', 'queue.py']
+    # Leaf frames of these functions mean the thread waits in go-judge with the GIL released.
+    # The diff functions are left out, they compare outputs on the judge's own CPU.
+    IDLE_FUNCS = [
+        ('executor_server.py', 'exec'),
+        ('executor_server.py', 'init_container'),
+        ('executor_server.py', 'file_list'),
+        ('executor_server.py', 'file_size'),
+        ('executor_server.py', 'file_delete'),
+    ]
+
+    @staticmethod
+    def idle(frame) -> bool:
+        filename = os.path.basename(frame.f_code.co_filename)
+        return filename in SamplingProfiler.IDLE_FILES or (filename, frame.f_code.co_name) in SamplingProfiler.IDLE_FUNCS
+
+    @staticmethod
+    def frame_label(frame) -> str:
+        code = frame.f_code
+        return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+    @staticmethod
+    def sample(stacks, own_ident, include_idle):
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == own_ident:
+                continue
+
+            if not include_idle and SamplingProfiler.idle(frame):
+                continue
+
+            labels = []
+            while frame is not None:
+                labels.append(SamplingProfiler.frame_label(frame))
+                frame = frame.f_back
+
+            labels.append(names.get(ident, f"thread-{ident}"))
+            stacks[';'.join(reversed(labels))] += 1
+
+    @staticmethod
+    def run(duration, include_idle):
+        stacks = collections.Counter()
+        own_ident = threading.get_ident()
+        start = time.monotonic()
+        samples = 0
+        while time.monotonic() - start < duration and not SamplingProfiler.stop_event.wait(config.PROFILE_INTERVAL):
+            SamplingProfiler.sample(stacks, own_ident, include_idle)
+            samples += 1
+
+        path = os.path.join(config.PROFILE_DIR, f"judge-{os.getpid()}-{int(time.time())}.collapsed")
+        try:
+            with open(path, 'w') as profile_file:
+                for stack, cnt in stacks.most_common():
+                    profile_file.write(f"{stack} {cnt}\n")
+
+            SamplingProfiler.last_path = path
+            utils.logger.info(f"SamplingProfiler wrote {samples} samples in {time.monotonic() - start:.1f}s to {path}")
+        except OSError as e:
+            utils.logger.error(f"SamplingProfiler failed to write {path}: {e}")
+
+        with SamplingProfiler.lock:
+            SamplingProfiler.thread = None
+
+    @staticmethod
+    def start(duration=None, include_idle=False) -> bool:
+        # Returns False if a profile is already being recorded
+        duration = min(duration or config.PROFILE_MAX_DURATION, config.PROFILE_MAX_DURATION)
+        with SamplingProfiler.lock:
+            if SamplingProfiler.thread is not None:
+                return False
+
+            SamplingProfiler.stop_event.clear()
+            SamplingProfiler.thread = threading.Thread(target=SamplingProfiler.run, args=(duration, include_idle), name='profiler', daemon=True)
+            SamplingProfiler.thread.start()
+
+        utils.logger.info(f"SamplingProfiler started for at most {duration}s")
+        return True
+
+    @staticmethod
+    def stop():
+        SamplingProfiler.stop_event.set()
+
+    @staticmethod
+    def toggle():
+        if not SamplingProfiler.start():
+            SamplingProfiler.stop()
+
+    @staticmethod
+    def status() -> dict:
+        return {
+            'running': SamplingProfiler.thread is not None,
+            'last_path': SamplingProfiler.last_path,
+        }
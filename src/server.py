@@ -1,7 +1,9 @@
 import decimal
 import json
+import signal
 import threading
-from queue import Queue
+import time
+from queue import PriorityQueue
 
 import tornado.httpserver
 import tornado.ioloop
@@ -15,13 +17,41 @@ import tornado.websocket
 import config
 import executor_server
 import utils
+from admission import MemoryAdmission
+from batch import ProblemBatch
+from calibrate import SpeedCalibration
+from cpupin import CpuPinning
+from fairshare import FairShare
+from filestore import FileStoreCollector
+from memo import ResultCache
+from prefetch import Prefetcher
+from profiler import SamplingProfiler
+from sjf import CostModel
+from stages import Stage
 from stdchal import StdChal
+from tracing import Tracer
+from warmup import Warmup
 
 
 class ChalObj:
-    def __init__(self, chal, callback_func):
+    seq = 0
+
+    def __init__(self, chal, callback_func, batch=None, resume=None, client='local'):
         self.chal = chal
         self.callback_func = callback_func
+        self.batch = batch
+        # StdChal whose deferred groups are left to judge, see pretest mode
+        self.resume = resume
+        # name of the connection that sent the chal, see FairShare
+        self.client = client
+        self.emit_time = time.monotonic_ns()
+        self.sort_key = CostModel.sort_key(chal, self.emit_time)
+
+        ChalObj.seq += 1
+        self.seq = ChalObj.seq
+
+    def __lt__(self, other):
+        return (self.sort_key, self.seq) < (other.sort_key, other.seq)
 
 class ChalPriority:
     NORMAL = 0
@@ -32,93 +62,263 @@ class ChalPriority:
 class JudgeDispatcher:
     judge_usage = 0
     chal_running_count = 0
-    chal_queues = [Queue() for _ in range(4)]
+    chal_queues = [PriorityQueue() for _ in range(4)]
     chal_set = set()
+    # chals running tests at once, the number of dedicated run cores when CPU pinning is on
+    run_slots = config.JUDGE_TASK_MAXCONCURRENT
+    free_slots = set(range(config.JUDGE_TASK_MAXCONCURRENT + config.COMPILE_MAXCONCURRENT))
+    batch_count = 0
+    compile_stage = Stage('compile', config.COMPILE_MAXCONCURRENT)
+    run_stage = Stage('run', config.JUDGE_TASK_MAXCONCURRENT)
     event = threading.Event()
 
     @staticmethod
-    def start_chal(obj):
+    def start_chal(chal_obj, slot, send):
+        # Returns the result, or None if the chal is parked on an identical chal being judged,
+        # its result is then handed to send when that chal is done
+        obj, batch, resume, callback_func, client = chal_obj.chal, chal_obj.batch, chal_obj.resume, chal_obj.callback_func, chal_obj.client
         chal_id = obj['chal_id']
-        code_path = obj['code_path']
-        res_path = obj['res_path']
-        test_list = obj['test']
-        metadata = obj['metadata']
-        comp_type = obj['comp_type']
-        check_type = obj['check_type']
-
-        test_paramlist = []
-        assert comp_type in ['gcc', 'g++', 'clang', 'clang++', 'makefile', 'python3', 'rustc', 'java']
-        assert check_type in ['diff', 'ioredir', 'diff-strict', 'cms']
-
-        memlimit, timelimit = 0, 0
-        for test in test_list:
-            try:
-                memlimit = int(test['memlimit'])
-                timelimit = int(test['timelimit'])
-            except ValueError:
-                pass
-
-            data_ids = test['metadata']['data']
-            t = []
-            for data_id in data_ids:
-                t.append({
-                    'in': f"{res_path}/testdata/{data_id}.in",
-                    'ans': f"{res_path}/testdata/{data_id}.out",
-                    'timelimit': timelimit * 10 ** 6, # INFO: toj 的時間是ms，所以要乘上10^6
-                    'memlimit': memlimit,
+        pri = obj['pri']
+        memo_key, memo_leader, memoized, parked, deferred, result = None, False, False, False, False, None
+
+        def follow(results):
+            if results is None:
+                # the result of the identical chal is not reusable, judge this one itself
+                FairShare.on_emit(client)
+                JudgeDispatcher.chal_queues[pri].put(ChalObj(dict(obj, no_cache=True), callback_func, client=client))
+            else:
+                JudgeDispatcher.chal_set.remove(chal_id)
+                send({
+                    'chal_id': chal_id,
+                    'results': results,
+                    'memoized': True,
                 })
 
-            test_paramlist.append(t)
-
-        chal = StdChal(chal_id, code_path, comp_type, check_type, res_path, test_paramlist, metadata)
+            JudgeDispatcher.event.set()
+
+        # the whole setup is inside the try so the slot, chal_id and batch are released whatever fails
+        try:
+            code_path = obj['code_path']
+            res_path = obj['res_path']
+            test_list = obj['test']
+            metadata = obj['metadata']
+            comp_type = obj['comp_type']
+            check_type = obj['check_type']
+
+            test_paramlist = []
+            assert comp_type in ['gcc', 'g++', 'clang', 'clang++', 'makefile', 'python3', 'rustc', 'java']
+            assert check_type in ['diff', 'ioredir', 'diff-strict', 'cms']
+
+            memlimit, timelimit = 0, 0
+            for test in test_list:
+                try:
+                    memlimit = int(test['memlimit'])
+                    timelimit = int(test['timelimit'])
+                except ValueError:
+                    pass
+
+                data_ids = test['metadata']['data']
+                t = []
+                for data_id in data_ids:
+                    t.append({
+                        'in': f"{res_path}/testdata/{data_id}.in",
+                        'ans': f"{res_path}/testdata/{data_id}.out",
+                        'timelimit': timelimit * 10 ** 6, # INFO: toj 的時間是ms，所以要乘上10^6
+                        'memlimit': memlimit,
+                    })
+
+                test_paramlist.append(t)
+
+            reserve = 1 if pri in [ChalPriority.CONTEST_REJUDGE, ChalPriority.NORMAL_REJUDGE] else 0
+            stages = {
+                'compile': lambda: JudgeDispatcher.compile_stage.enter(pri),
+                'run': lambda: JudgeDispatcher.run_stage.enter(pri, reserve),
+            }
+            if resume is not None:
+                chal = resume
+                chal.stages = stages
+            else:
+                chal = StdChal(chal_id, code_path, comp_type, check_type, res_path, test_paramlist, metadata, batch, stages, obj.get('mode'))
+
+            # pretest mode judges the pretest groups first and defers the rest at a lower priority
+            pretest = resume is None and batch is None and obj.get('mode') == 'pretest'
+
+            if config.RESULT_CACHE_SIZE > 0 and not obj.get('no_cache', False) and obj.get('mode') != 'pretest':
+                memo_key = ResultCache.key(obj)
+
+            with Tracer.span('chal', chal_id=chal_id, slot=slot, pri=pri, comp_type=comp_type, check_type=check_type):
+                if memo_key is not None:
+                    result, memo_leader = ResultCache.acquire(memo_key, follow)
+                    memoized = result is not None
+                    parked = not memoized and not memo_leader
+
+                if resume is not None:
+                    result = chal.resume()
+                elif pretest:
+                    result = chal.start(metadata.get('pretest', [0]))
+                    deferred = bool(chal.deferred)
+                elif not memoized and not parked:
+                    result = chal.start()
+        finally:
+            if memo_leader:
+                ResultCache.complete(memo_key, result)
+            if not deferred:
+                FileStoreCollector.release_chal(chal_id)
+            if batch is not None:
+                batch.release()
+            if slot is not None:
+                JudgeDispatcher.free_slots.add(slot)
+            JudgeDispatcher.chal_running_count -= 1
+            FairShare.on_done(client, not deferred)
+            if deferred:
+                # chal_id stays in chal_set until the deferred groups are done
+                deferred_pri = max(pri, config.PRETEST_DEFERRED_PRI)
+                FairShare.on_emit(client)
+                JudgeDispatcher.chal_queues[deferred_pri].put(ChalObj(dict(obj, pri=deferred_pri), callback_func, resume=chal, client=client))
+            elif not parked:
+                # a parked chal_id stays in chal_set until follow is called
+                JudgeDispatcher.chal_set.remove(chal_id)
+            JudgeDispatcher.event.set()
+
+        if parked:
+            return None
 
-        result = chal.start()
         res = {
             'chal_id': chal_id,
             'results': result
         }
-        JudgeDispatcher.chal_running_count -= 1
-        JudgeDispatcher.chal_set.remove(chal_id)
+        if memoized:
+            res['memoized'] = True
+        if deferred:
+            res['pretest'] = True
+        if resume is not None:
+            res['update'] = True
         return res
 
     @staticmethod
     def running(loop):
         while JudgeDispatcher.event.wait():
-            all_clear = True
+            # cleared before scanning, so a chal emitted or finished meanwhile triggers another scan
+            JudgeDispatcher.event.clear()
             for idx, queue in enumerate(JudgeDispatcher.chal_queues):
                 if queue.empty():
                     continue
 
-                all_clear = False
-
-                max_cnt = config.JUDGE_TASK_MAXCONCURRENT
+                # chals beyond the run stage capacity compile ahead while earlier chals run their tests
+                max_cnt = JudgeDispatcher.run_slots + config.COMPILE_MAXCONCURRENT
                 if idx == ChalPriority.CONTEST_REJUDGE or idx == ChalPriority.NORMAL_REJUDGE:
                     max_cnt -= 1
 
                 while not queue.empty() and JudgeDispatcher.chal_running_count < max_cnt:
-                    chal_obj = queue.get()
-                    chal, callback_func = chal_obj.chal, chal_obj.callback_func
+                    chal_obj = FairShare.pick(queue)
+                    if chal_obj is None:
+                        # every client with queued chals is at its quota
+                        break
+
+                    chal = chal_obj.chal
                     JudgeDispatcher.chal_running_count += 1
+                    slot = JudgeDispatcher.free_slots.pop() if JudgeDispatcher.free_slots else None
+                    Prefetcher.on_start(chal['chal_id'])
+                    Tracer.record('queue', chal_obj.emit_time, time.monotonic_ns(), chal_id=chal['chal_id'], slot=slot, pri=idx)
+
+                    def run(chal_obj, slot):
+                        def send(results):
+                            loop.add_callback(lambda: chal_obj.callback_func(results))
+
+                        try:
+                            results = JudgeDispatcher.start_chal(chal_obj, slot, send)
+                        except Exception as e:
+                            # start_chal has released the slot and the chal_id, the sender still gets an answer
+                            utils.logger.exception(f"Chal {chal_obj.chal.get('chal_id')} failed: {e}")
+                            results = {
+                                'chal_id': chal_obj.chal.get('chal_id'),
+                                'results': None,
+                                'error': str(e),
+                            }
+
+                        if results is not None:
+                            send(results)
+
+                    t = threading.Thread(target=run, args=(chal_obj, slot))
+                    t.start()
 
-                    def run():
-                        results = JudgeDispatcher.start_chal(chal)
-                        loop.add_callback(lambda: callback_func(results))
+    @staticmethod
+    def set_run_slots(run_slots):
+        # called before the dispatcher starts
+        JudgeDispatcher.run_slots = run_slots
+        JudgeDispatcher.free_slots = set(range(run_slots + config.COMPILE_MAXCONCURRENT))
+        JudgeDispatcher.run_stage.capacity = run_slots
 
-                    t = threading.Thread(target=run)
-                    t.start()
+    @staticmethod
+    def queued_count():
+        return sum(queue.qsize() for queue in JudgeDispatcher.chal_queues)
 
-            if all_clear:
-                JudgeDispatcher.event.clear()
+    @staticmethod
+    def capacity():
+        max_cnt = JudgeDispatcher.run_slots + config.COMPILE_MAXCONCURRENT
+        free_slots = max(0, max_cnt - JudgeDispatcher.chal_running_count)
+        queued = JudgeDispatcher.queued_count()
+        return {
+            'free_slots': free_slots,
+            'queue': [queue.qsize() for queue in JudgeDispatcher.chal_queues],
+            # chals the backend can send that will start soon
+            'credits': max(0, free_slots + config.JUDGE_QUEUE_TARGET - queued),
+            'queue_limit': config.JUDGE_QUEUE_LIMIT,
+            # < 1 on nodes slower than the reference machine
+            'speed_factor': SpeedCalibration.factor,
+        }
 
     @staticmethod
-    def emit_chal(obj, callback_func):
+    def emit_chal(obj, callback_func, client='local'):
         pri = obj['pri']
         assert ChalPriority.NORMAL <= pri <= ChalPriority.NORMAL_REJUDGE
         if obj is not None and obj['chal_id'] not in JudgeDispatcher.chal_set:
+            if JudgeDispatcher.queued_count() >= config.JUDGE_QUEUE_LIMIT:
+                return False
+
+            # built before any shared state changes, so a chal that fails here can be sent again
+            chal_obj = ChalObj(obj, callback_func, client=client)
             JudgeDispatcher.chal_set.add(obj['chal_id'])
-            JudgeDispatcher.chal_queues[pri].put(ChalObj(obj, callback_func))
+            FairShare.on_emit(client)
+            JudgeDispatcher.chal_queues[pri].put(chal_obj)
+
+        JudgeDispatcher.event.set()
+        return True
+
+    @staticmethod
+    def emit_batch(obj, callback_func, client='local'):
+        # Batch rejudge of many chals of one problem, queued back to back so they share the checker and answers
+        pri = obj['pri']
+        assert ChalPriority.NORMAL <= pri <= ChalPriority.NORMAL_REJUDGE
+
+        chals, rejected, chal_ids = [], [], set()
+        room = config.JUDGE_QUEUE_LIMIT - JudgeDispatcher.queued_count()
+        for chal in obj['chals']:
+            if chal['chal_id'] in JudgeDispatcher.chal_set or chal['chal_id'] in chal_ids:
+                continue
+
+            chal_ids.add(chal['chal_id'])
+
+            assert chal['res_path'] == obj['chals'][0]['res_path']
+            if len(chals) >= room:
+                rejected.append(chal['chal_id'])
+                continue
+
+            chal['pri'] = pri
+            chals.append(chal)
+
+        if chals:
+            JudgeDispatcher.batch_count += 1
+            batch = ProblemBatch(f"batch-{JudgeDispatcher.batch_count}", chals[0]['res_path'], len(chals))
+            chal_objs = [ChalObj(chal, callback_func, batch, client=client) for chal in chals]
+            utils.logger.info(f"ProblemBatch {batch.batch_id} queued {len(chals)} chals of {batch.res_path}")
+            for chal_obj in chal_objs:
+                JudgeDispatcher.chal_set.add(chal_obj.chal['chal_id'])
+                FairShare.on_emit(client)
+                JudgeDispatcher.chal_queues[pri].put(chal_obj)
 
         JudgeDispatcher.event.set()
+        return rejected
 
 class Encoder(json.JSONEncoder):
     def default(self, o):
@@ -127,49 +327,175 @@ class Encoder(json.JSONEncoder):
         return super().default(o)
 
 class JudgeWebSocketClient(tornado.websocket.WebSocketHandler):
+    # connections that asked for capacity reports
+    capacity_clients = set()
+    conn_count = 0
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.settings['websocket_ping_interval'] = 5
 
     async def open(self):
-        utils.logger.info('Backend connected')
+        # backends name themselves with /judge?client=<name> to get the weight and quota of that name
+        JudgeWebSocketClient.conn_count += 1
+        self.named = self.get_argument('client', None) is not None
+        self.client = self.get_argument('client', f"conn-{JudgeWebSocketClient.conn_count}")
+        utils.logger.info(f'Backend {self.client} connected')
 
     async def on_message(self, msg):
         obj = json.loads(msg)
         self.ping()
 
-        JudgeDispatcher.emit_chal(obj, lambda res: self.write_message(json.dumps(res, cls=Encoder)))
+        if obj.get('type') == 'capacity':
+            JudgeWebSocketClient.capacity_clients.add(self)
+            self.send_capacity()
+            return
+
+        if 'chals' in obj:
+            rejected = JudgeDispatcher.emit_batch(obj, self.send_result, self.client)
+        elif not JudgeDispatcher.emit_chal(obj, self.send_result, self.client):
+            rejected = [obj['chal_id']]
+        else:
+            rejected = []
+
+        for chal_id in rejected:
+            self.write_message(json.dumps({
+                'chal_id': chal_id,
+                'rejected': True,
+                'reason': 'queue full',
+            }))
+
+        JudgeWebSocketClient.broadcast_capacity()
+
+    def send_result(self, res):
+        self.write_message(json.dumps(res, cls=Encoder))
+        JudgeWebSocketClient.broadcast_capacity()
+
+    def send_capacity(self):
+        self.write_message(json.dumps({
+            'type': 'capacity',
+            **JudgeDispatcher.capacity(),
+        }))
+
+    @staticmethod
+    def broadcast_capacity():
+        for client in list(JudgeWebSocketClient.capacity_clients):
+            try:
+                client.send_capacity()
+            except tornado.websocket.WebSocketClosedError:
+                JudgeWebSocketClient.capacity_clients.discard(client)
 
     def on_close(self):
+        JudgeWebSocketClient.capacity_clients.discard(self)
+        if not self.named:
+            # conn-N names are never reused, named clients keep their share and stats across reconnects
+            FairShare.close(self.client)
         print(self.close_code, self.close_reason)
-        utils.logger.info(f'Backend disconnected close_code: {self.close_code} close_reason: {self.close_reason}')
+        utils.logger.info(f'Backend {self.client} disconnected close_code: {self.close_code} close_reason: {self.close_reason}')
 
     def check_origin(self, _: str) -> bool:
         return True
 
+class TraceHandler(tornado.web.RequestHandler):
+    def get(self):
+        self.set_header('Content-Type', 'application/json')
+        self.write(json.dumps(Tracer.export()))
+
+class ReadyHandler(tornado.web.RequestHandler):
+    def get(self):
+        self.set_header('Content-Type', 'application/json')
+        if not Warmup.ready:
+            self.set_status(503)
+
+        self.write(json.dumps({'ready': Warmup.ready}))
+
+class StatsHandler(tornado.web.RequestHandler):
+    def get(self):
+        self.set_header('Content-Type', 'application/json')
+        self.write(json.dumps({
+            'filestore': FileStoreCollector.stats(),
+            'memory_admission': MemoryAdmission.stats(),
+            'stdchal': StdChal.stats(),
+            'result_cache': ResultCache.stats(),
+            'prefetch': Prefetcher.stats(),
+            'compile_stage': JudgeDispatcher.compile_stage.stats(),
+            'run_stage': JudgeDispatcher.run_stage.stats(),
+            'clients': FairShare.stats(),
+            'speed': SpeedCalibration.stats(),
+        }))
+
+class ProfileHandler(tornado.web.RequestHandler):
+    def get(self):
+        self.set_header('Content-Type', 'application/json')
+        self.write(json.dumps(SamplingProfiler.status()))
+
+    def post(self):
+        # POST /profile?seconds=30&idle=1 records all threads for 30 seconds, idle ones included
+        seconds = float(self.get_argument('seconds', config.PROFILE_MAX_DURATION))
+        include_idle = self.get_argument('idle', '0') == '1'
+        if not SamplingProfiler.start(seconds, include_idle):
+            self.set_status(409)
+
+        self.set_header('Content-Type', 'application/json')
+        self.write(json.dumps(SamplingProfiler.status()))
+
+    def delete(self):
+        SamplingProfiler.stop()
+        self.set_header('Content-Type', 'application/json')
+        self.write(json.dumps(SamplingProfiler.status()))
+
 def init_socket_server():
     app = tornado.web.Application([
         (r"/judge", JudgeWebSocketClient),
+        (r"/trace", TraceHandler),
+        (r"/ready", ReadyHandler),
+        (r"/stats", StatsHandler),
+        (r"/profile", ProfileHandler),
     ])
     app.listen(2502)
 
-def main():
-    utils.logger.info("Judge Start")
+def init_executor():
+    if config.CPU_PINNING and CpuPinning.init():
+        JudgeDispatcher.set_run_slots(len(CpuPinning.run_cpus))
+
     executor_server.init()
-    err = executor_server.init_container({
+    return executor_server.init_container({
         "cinitPath": "./cinit",
-        "parallelism": 4
+        "parallelism": CpuPinning.parallelism()
     })
+
+def main():
+    utils.logger.info("Judge Start")
+    err = init_executor()
     if err:
         utils.logger.error("Failed to init container")
         return
 
+    if config.SPEED_CALIBRATION:
+        # before accepting chals, so no chal is judged with an uncalibrated limit
+        SpeedCalibration.calibrate()
+        t = threading.Thread(target=SpeedCalibration.running, args=(lambda: JudgeDispatcher.chal_running_count > 0, ), daemon=True)
+        t.start()
+
     init_socket_server()
+    signal.signal(signal.SIGUSR2, lambda signum, frame: SamplingProfiler.toggle())
 
     loop = tornado.ioloop.IOLoop.current()
     t = threading.Thread(target=JudgeDispatcher.running, args=(loop, ))
     t.start()
+
+    t = threading.Thread(target=FileStoreCollector.running, daemon=True)
+    t.start()
+
+    if config.PREFETCH_LOOKAHEAD > 0:
+        t = threading.Thread(target=Prefetcher.running, args=(JudgeDispatcher.chal_queues, ), daemon=True)
+        t.start()
+
+    if config.WARMUP_ENABLED:
+        t = threading.Thread(target=Warmup.run)
+        t.start()
+    else:
+        Warmup.ready = True
     loop.start()
 
 if __name__ == "__main__":
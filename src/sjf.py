@@ -0,0 +1,47 @@
+import threading
+
+import config
+
+
+class CostModel:
+    """Expected sandbox time of a chal, used to start cheaper chals first within a priority."""
+
+    # comp_type -> moving average of compile time (ns)
+    compile_time = {}
+    lock = threading.Lock()
+
+    @staticmethod
+    def record_compile(comp_type, elapsed):
+        with CostModel.lock:
+            if comp_type not in CostModel.compile_time:
+                CostModel.compile_time[comp_type] = elapsed
+            else:
+                CostModel.compile_time[comp_type] += (elapsed - CostModel.compile_time[comp_type]) * config.SJF_COMPILE_EMA
+
+    @staticmethod
+    def estimate(chal) -> int:
+        cost = CostModel.compile_time.get(chal.get('comp_type'), 0)
+        # malformed tests count as free here, start_chal reports them
+        for test in chal.get('test', []):
+            try:
+                timelimit = int(test['timelimit'])
+            except (KeyError, TypeError, ValueError):
+                timelimit = 0
+
+            try:
+                data_count = len(test['metadata']['data'])
+            except (KeyError, TypeError):
+                data_count = 0
+
+            cost += data_count * timelimit * 10 ** 6
+
+        return int(cost)
+
+    @staticmethod
+    def sort_key(chal, emit_time) -> int:
+        # Cost is capped by the aging bound, so a chal is never overtaken by chals
+        # arriving more than SJF_AGING_BOUND seconds after it.
+        if not config.SJF_ENABLED:
+            return emit_time
+
+        return emit_time + min(CostModel.estimate(chal), config.SJF_AGING_BOUND * 10 ** 9)
@@ -0,0 +1,70 @@
+import contextlib
+import heapq
+import threading
+import time
+
+from tracing import Tracer
+
+
+class Stage:
+    """A pipeline stage with its own concurrency limit, granted in priority order (lower pri first)."""
+
+    def __init__(self, name, capacity):
+        self.name = name
+        self.capacity = capacity
+        self.busy = 0
+        self.waiting = []
+        self.seq = 0
+        self.cond = threading.Condition()
+
+        self.created = time.monotonic_ns()
+        self.last = self.created
+        self.busy_ns = 0
+        self.wait_ns = 0
+        self.entered = 0
+
+    @contextlib.contextmanager
+    def enter(self, pri=0, reserve=0):
+        # reserve: number of units this priority must leave free for more urgent work
+        start = time.monotonic_ns()
+        with self.cond:
+            self.seq += 1
+            ticket = (pri, self.seq)
+            heapq.heappush(self.waiting, ticket)
+            while self.waiting[0] != ticket or self.busy >= max(self.capacity - reserve, 1):
+                self.cond.wait()
+
+            heapq.heappop(self.waiting)
+            self._account()
+            self.busy += 1
+            self.entered += 1
+            self.wait_ns += time.monotonic_ns() - start
+            self.cond.notify_all()
+
+        Tracer.record(f'{self.name}_wait', start, time.monotonic_ns(), **Tracer.current())
+        try:
+            yield
+        finally:
+            with self.cond:
+                self._account()
+                self.busy -= 1
+                self.cond.notify_all()
+
+    def _account(self):
+        now = time.monotonic_ns()
+        self.busy_ns += self.busy * (now - self.last)
+        self.last = now
+
+    def stats(self) -> dict:
+        with self.cond:
+            self._account()
+            elapsed = self.last - self.created
+
+        return {
+            'capacity': self.capacity,
+            'busy': self.busy,
+            'waiting': len(self.waiting),
+            'entered': self.entered,
+            'wait_ms': self.wait_ns // 10 ** 6,
+            'utilization': self.busy_ns / (self.capacity * elapsed) if elapsed > 0 else 0,
+        }
@@ -1,10 +1,18 @@
 import os
+import contextlib
+import copy
 import decimal
 import threading
+import time
 from typing import Dict, List
 
+import config
 import executor_server
 import utils
+from calibrate import SpeedCalibration
+from filestore import FileStoreCollector
+from sjf import CostModel
+from tracing import Tracer
 
 
 class GoJudgeStatus:
@@ -30,6 +38,7 @@ class Status:
     CompileLimitExceeded = 10 # 沒事不要炸Judge
     InternalError = 11
     SpecialJudgeError = 12
+    Skipped = 13
     """
     Accepted = 1
     PartialCorrect = 2
@@ -66,7 +75,11 @@ SignalErrorMessage = {
 }
 
 class StdChal:
-    def __init__(self, chal_id: int, code_path: str, comp_typ: str, judge_typ: str, res_path: str, test_list: List, metadata: Dict) -> None:
+    remeasure_count = 0
+    remeasure_changed = 0
+    stats_lock = threading.Lock()
+
+    def __init__(self, chal_id: int, code_path: str, comp_typ: str, judge_typ: str, res_path: str, test_list: List, metadata: Dict, batch=None, stages=None, mode=None) -> None:
         self.code_path = code_path
         self.res_path = res_path
         self.comp_typ = comp_typ
@@ -75,6 +88,30 @@ class StdChal:
         self.metadata = metadata
         self.chal_id = chal_id
         self.chal_path = None
+        self.trace_args = {}
+        self.batch = batch
+        # stage name ('compile', 'run') -> factory of the context manager gating that stage
+        self.stages = stages if stages is not None else {}
+        self.fileid = None
+        self.checker_fileid = None
+        self.class_name = None
+        self.run_args = None
+        # 'first_failure' stops every group once any test fails
+        self.mode = mode
+        self.first_failure = threading.Event()
+        self.deferred = []
+        self.remeasure_budget = config.REMEASURE_BUDGET
+        # comp_typ -> compiler flags, see config.COMPILE_FLAGS
+        self.compile_flags = config.COMPILE_FLAGS
+        # (cpu time ns, sandbox wall time ns, peak memory bytes) of the last compile
+        self.compile_usage = None
+        # time limits and reported times are in reference machine time, see SpeedCalibration
+        self.speed_factor = SpeedCalibration.limit_factor()
+        if self.speed_factor != 1.0:
+            for test_groups in test_list:
+                for test in test_groups:
+                    test['timelimit'] = int(test['timelimit'] / self.speed_factor)
+        self.lock = threading.Lock()
 
         self.results = []
         for _ in range(len(test_list)):
@@ -87,51 +124,123 @@ class StdChal:
                 "score_type": "NONE",
             })
 
-    def start(self):
+    def start(self, groups=None):
+        # groups: judge only these groups now, the others are left for resume()
         utils.logger.info(f"StdChal {self.chal_id} started")
-        if self.comp_typ in ['g++', 'clang++']:
-            res, verdict = self.comp_cxx()
+        self.trace_args = Tracer.current()
+        with self.stage('compile'):
+            prepared = self.prepare()
 
-        elif self.comp_typ in ['gcc', 'clang']:
-            res, verdict = self.comp_c()
+        if prepared is None:
+            utils.logger.warning(f"StdChal {self.chal_id} uses an unsupported language.")
+            return
 
-        elif self.comp_typ == 'makefile':
-            res, verdict = self.comp_make()
+        if not prepared:
+            return self.results
 
-        elif self.comp_typ == 'python3':
-            res, verdict = self.comp_python()
+        with self.stage('run'):
+            self.judge(groups)
 
-        elif self.comp_typ == 'rustc':
-            res, verdict = self.comp_rustc()
+        if groups is not None:
+            self.deferred = [i for i in range(len(self.test_list)) if i not in groups]
+            if self.deferred:
+                utils.logger.info(f"StdChal {self.chal_id} pretest done, {len(self.deferred)} groups deferred")
+                return self.partial_results(groups)
 
-        elif self.comp_typ == 'java':
-            t, class_name = self.comp_java()
-            res, verdict = t
-        else:
-            utils.logger.warning(f"StdChal {self.chal_id} uses an unsupported language.")
+        self.cleanup()
+        return self.finish()
+
+    def resume(self):
+        self.trace_args = Tracer.current()
+        with self.stage('run'):
+            self.judge(self.deferred)
+
+        self.deferred = []
+        self.cleanup()
+        return self.finish()
+
+    def partial_results(self, groups):
+        # Results of the judged groups, deferred groups are still None
+        results = copy.deepcopy(self.results)
+        v = '\n'.join(f"Task {idx + 1}: {res['verdict']}" for idx, res in enumerate(results) if idx in groups and res['verdict'] != "")
+
+        for idx, res in enumerate(results):
+            if idx not in groups:
+                continue
+
+            if res['status'] is None:
+                res['status'] = Status.InternalError
+
+            res['verdict'] = v
+
+        self.scale_time(results)
+        return results
+
+    def finish(self):
+        v = '\n'.join(f"Task {idx + 1}: {res['verdict']}" for idx, res in enumerate(self.results) if res['verdict'] != "")
+
+        for res in self.results:
+            if res['status'] is None:
+                res['status'] = Status.InternalError
+
+            res['verdict'] = v
+
+        self.scale_time(self.results)
+        utils.logger.info(f"StdChal {self.chal_id} done")
+        return self.results
+
+    def scale_time(self, results):
+        if self.speed_factor == 1.0:
             return
 
+        for res in results:
+            if res['status'] not in [Status.CompileError, Status.CompileLimitExceeded]:
+                res['time'] = int(res['time'] * self.speed_factor)
+
+    def stage(self, name):
+        if name not in self.stages:
+            return contextlib.nullcontext()
+
+        return self.stages[name]()
+
+    def prepare(self):
+        compile_start = time.monotonic_ns()
+        with Tracer.span('compile', comp_typ=self.comp_typ):
+            res, verdict, class_name = self.compile()
+        CostModel.record_compile(self.comp_typ, time.monotonic_ns() - compile_start)
+
+        if res is None:
+            return None
+
         checker_fileid = None
         fileid = verdict
 
         if self.judge_typ in ['ioredir', 'cms']:
-            checker_res, checker_fileid = self.comp_checker()
+            with Tracer.span('checker_compile'):
+                if self.batch is not None:
+                    checker_res, checker_fileid = self.batch.checker(self)
+                else:
+                    checker_res, checker_fileid = self.comp_checker()
+
             if checker_res != GoJudgeStatus.Accepted:
                 for res in self.results:
                     res['status'] = Status.SpecialJudgeError
 
                 utils.logger.warning(f"StdChal {self.chal_id} checker compile failed")
-                if checker_fileid and executor_server.file_delete(checker_fileid) == 0:
-                    utils.logger.warning(f"StdChal {self.chal_id} delete cached checker file {fileid} failed.")
+                if not self.delete_checker(checker_fileid):
+                    utils.logger.warning(f"StdChal {self.chal_id} delete cached checker file {checker_fileid} failed.")
 
-                if executor_server.file_delete(fileid) == 0:
+                if not FileStoreCollector.delete(self.chal_id, fileid):
                     utils.logger.warning(f"StdChal {self.chal_id} delete cached file {fileid} failed.")
 
-                return self.results
+                return False
 
         utils.logger.info(f"StdChal {self.chal_id} compiled")
         if res != GoJudgeStatus.Accepted:
-            return self.results
+            if not self.delete_checker(checker_fileid):
+                utils.logger.warning(f"StdChal {self.chal_id} delete cached checker file {checker_fileid} failed.")
+
+            return False
 
         if self.comp_typ == "python3":
             args = ["/usr/bin/python3", "a"]
@@ -140,60 +249,272 @@ class StdChal:
         else:
             args = ["a"]
 
+        self.fileid = fileid
+        self.checker_fileid = checker_fileid
+        self.class_name = class_name
+        self.run_args = args
+        return True
+
+    def judge(self, groups=None):
         tasks = []
         if self.comp_typ != 'java':
             for i, test_groups in enumerate(self.test_list):
-                t = threading.Thread(target=self.judge_diff_group, args=(i, test_groups, fileid, checker_fileid, args))
+                if groups is not None and i not in groups:
+                    continue
+
+                t = threading.Thread(target=self.judge_diff_group, args=(i, test_groups, self.fileid, self.checker_fileid, self.run_args))
                 t.start()
                 tasks.append(t)
         else:
             for i, test_groups in enumerate(self.test_list):
-                t = threading.Thread(target=self.judge_diff_group_for_java, args=(i, class_name, test_groups, fileid, args))
+                if groups is not None and i not in groups:
+                    continue
+
+                t = threading.Thread(target=self.judge_diff_group_for_java, args=(i, self.class_name, test_groups, self.fileid, self.run_args))
                 t.start()
                 tasks.append(t)
 
         for task in tasks:
             task.join()
 
-        if checker_fileid and executor_server.file_delete(checker_fileid) == 0:
-            utils.logger.warning(f"StdChal {self.chal_id} delete cached checker file {fileid} failed.")
+    def cleanup(self):
+        if not self.delete_checker(self.checker_fileid):
+            utils.logger.warning(f"StdChal {self.chal_id} delete cached checker file {self.checker_fileid} failed.")
 
-        if executor_server.file_delete(fileid) == 0:
-            utils.logger.warning(f"StdChal {self.chal_id} delete cached file {fileid} failed.")
+        if not FileStoreCollector.delete(self.chal_id, self.fileid):
+            utils.logger.warning(f"StdChal {self.chal_id} delete cached file {self.fileid} failed.")
 
-        v = '\n'.join(f"Task {idx + 1}: {res['verdict']}" for idx, res in enumerate(self.results) if res['verdict'] != "")
+    def delete_checker(self, checker_fileid) -> bool:
+        # The checker of a batch is shared, ProblemBatch deletes it after the last chal
+        if self.batch is not None:
+            return True
 
-        for res in self.results:
-            if res['status'] is None:
-                res['status'] = Status.InternalError
+        return FileStoreCollector.delete(self.chal_id, checker_fileid)
 
-            res['verdict'] = v
+    def read_answer(self, ans_path) -> str:
+        if self.batch is not None:
+            return self.batch.answer(ans_path)
 
-        utils.logger.info(f"StdChal {self.chal_id} done")
-        return self.results
+        with open(ans_path, 'r') as ans_file:
+            return ans_file.read()
+
+    def output_limit(self, ans_path) -> int:
+        # stdout cap of a run, a runaway printer ends early as OLE instead of filling 256M
+        if 'output_limit' in self.metadata:
+            return min(int(self.metadata['output_limit']), config.OUTPUT_LIMIT_MAX)
+
+        # Special judge outputs need not look like the answer file
+        if self.judge_typ not in ['diff', 'diff-strict']:
+            return config.OUTPUT_LIMIT_MAX
+
+        try:
+            ans_size = os.path.getsize(ans_path)
+        except OSError:
+            return config.OUTPUT_LIMIT_MAX
+
+        return min(ans_size * config.OUTPUT_LIMIT_FACTOR + config.OUTPUT_LIMIT_SLACK, config.OUTPUT_LIMIT_MAX)
+
+    def group_failed(self, group_index) -> bool:
+        if self.results[group_index]['status'] == Status.Accepted:
+            return False
+
+        if self.mode == 'first_failure':
+            self.first_failure.set()
+
+        return True
+
+    def group_skipped(self, group_index) -> bool:
+        # In first_failure mode a failed test of any group stops all the other groups
+        if not self.first_failure.is_set():
+            return False
+
+        if self.results[group_index]['status'] in [Status.Accepted, None]:
+            self.results[group_index]['status'] = Status.Skipped
+
+        return True
 
     def judge_diff_group(self, group_index, test_groups, fileid, checker_fileid, run_args):
         if self.judge_typ == 'ioredir' and checker_fileid is not None:
-            for tests in test_groups:
-                self.judge_diff_ioredir(run_args, group_index, fileid, checker_fileid, tests['in'], tests['ans'], tests['timelimit'], tests['memlimit'])
-                if self.results[group_index]['status'] != Status.Accepted:
+            for test_index, tests in enumerate(test_groups):
+                if self.group_skipped(group_index):
                     break
 
+                with Tracer.span('test', **self.trace_args, group=group_index, test=test_index):
+                    self.judge_diff_ioredir(run_args, group_index, fileid, checker_fileid, tests['in'], tests['ans'], tests['timelimit'], tests['memlimit'])
+                if self.group_failed(group_index):
+                    break
+
+        elif self.judge_typ == 'cms' and checker_fileid is not None and self.metadata.get('batch_checker', False):
+            self.judge_diff_group_cms_batch(group_index, test_groups, fileid, checker_fileid, run_args)
+
+        elif self.judge_typ == 'cms' and checker_fileid is not None and config.CMS_PIPELINE:
+            self.judge_diff_group_cms_pipelined(group_index, test_groups, fileid, checker_fileid, run_args)
+
         elif self.judge_typ == 'cms' and checker_fileid is not None:
-            for tests in test_groups:
-                self.judge_diff_cms(run_args, group_index, fileid, checker_fileid, tests['in'], tests['ans'], tests['timelimit'], tests['memlimit'])
-                if self.results[group_index]['status'] != Status.Accepted:
+            for test_index, tests in enumerate(test_groups):
+                if self.group_skipped(group_index):
+                    break
+
+                with Tracer.span('test', **self.trace_args, group=group_index, test=test_index):
+                    self.judge_diff_cms(run_args, group_index, fileid, checker_fileid, tests['in'], tests['ans'], tests['timelimit'], tests['memlimit'])
+                if self.group_failed(group_index):
                     break
         else:
-            for tests in test_groups:
-                self.judge_diff(run_args, group_index, fileid, tests['in'], tests['ans'], tests['timelimit'], tests['memlimit'])
-                if self.results[group_index]['status'] != Status.Accepted:
+            for test_index, tests in enumerate(test_groups):
+                if self.group_skipped(group_index):
+                    break
+
+                with Tracer.span('test', **self.trace_args, group=group_index, test=test_index):
+                    self.judge_diff(run_args, group_index, fileid, tests['in'], tests['ans'], tests['timelimit'], tests['memlimit'])
+                if self.group_failed(group_index):
+                    break
+
+    def judge_diff_group_cms_batch(self, group_index, test_groups, fileid, checker_fileid, run_args):
+        # Run the user program on every test of the group, then check all outputs in one checker exec.
+        # The checker is called as `check --batch manifest`, every manifest line is `in ans out` of one test
+        # and it prints one `score_type;score;status` line per test, in manifest order. The exit status of the
+        # checker stands in for the status of the lines that leave it empty, as with a single check.
+        result = self.results[group_index]
+        runs = []
+        stopped = False
+        try:
+            for test_index, tests in enumerate(test_groups):
+                if self.first_failure.is_set():
+                    stopped = True
                     break
 
+                with Tracer.span('test', **self.trace_args, group=group_index, test=test_index):
+                    res = self.run_cms(run_args, fileid, tests['in'], tests['ans'], tests['timelimit'], tests['memlimit'])
+                runs.append((tests, res))
+                if res['status'] != GoJudgeStatus.Accepted:
+                    break
+
+            accepted = [(tests, res) for tests, res in runs if res['status'] == GoJudgeStatus.Accepted]
+            checker_res, checker_lines = None, []
+            if accepted:
+                with Tracer.span('checker', **self.trace_args, group=group_index):
+                    checker_res = self.exec_cms_batch_checker(checker_fileid, accepted)
+                checker_lines = checker_res['files']['stdout'].splitlines()
+
+            for i, (tests, res) in enumerate(runs):
+                test_checker_res = None
+                if res['status'] == GoJudgeStatus.Accepted:
+                    # parsed like the stdout of a single check, an empty or unknown status leaves the verdict to the exit status
+                    test_checker_res = {
+                        'status': checker_res['status'],
+                        'files': {
+                            'stdout': checker_lines[i].strip() if i < len(checker_lines) else '',
+                            'stderr': checker_res['files'].get('stderr', ''),
+                        },
+                    }
+
+                self.update_cms_result(res, result, test_checker_res)
+                if self.group_failed(group_index):
+                    break
+
+            if stopped:
+                self.group_skipped(group_index)
+
+        finally:
+            for tests, res in runs:
+                if not FileStoreCollector.delete(self.chal_id, res['fileIds']['stdout']):
+                    utils.logger.warning(f"StdChal {self.chal_id} delete cached stdout file {res['fileIds']['stdout']} failed.")
+
+    def exec_cms_batch_checker(self, checker_fileid, runs):
+        copy_in = {
+            "check": {
+                "fileId": checker_fileid
+            },
+            "manifest": {
+                "content": ''.join(f"in{i} ans{i} out{i}\n" for i in range(len(runs)))
+            },
+        }
+        for i, (tests, res) in enumerate(runs):
+            copy_in[f"in{i}"] = {"src": tests['in']}
+            copy_in[f"ans{i}"] = {"src": tests['ans']}
+            copy_in[f"out{i}"] = {"fileId": res['fileIds']['stdout']}
+
+        res = executor_server.exec({
+            "cmd": [{
+                "args": ["check", "--batch", "manifest"],
+                "env": ["PATH=/usr/bin:/bin"],
+                "files": [{
+                    "content": ""
+                }, {
+                    "name": "stdout",
+                    "max": 10240 + 128 * len(runs)
+                }, {
+                    "name": "stderr",
+                    "max": 10240,
+                }],
+                "cpuLimit": sum(tests['timelimit'] for tests, _ in runs) * 2,
+                "memoryLimit": max(tests['memlimit'] for tests, _ in runs),
+                "stackLimit": 65536 * 1024,
+                "procLimit": 10,
+                "cpuRateLimit": 1000,
+                "strictMemoryLimit": False, # 開了會直接Signalled，會讓使用者沒辦法判斷
+                "copyIn": copy_in,
+                "copyOut": ["stdout", "stderr"]
+            }]
+        }, pin='check')
+        return res["results"][0]
+
+    def judge_diff_group_cms_pipelined(self, group_index, test_groups, fileid, checker_fileid, run_args):
+        # The checker of test N runs in another thread while the user program runs on test N + 1.
+        # Only one checker is in flight at a time, so the result is still updated in test order.
+        result = self.results[group_index]
+        checking = None
+        stopped = False
+        for test_index, tests in enumerate(test_groups):
+            if self.first_failure.is_set():
+                stopped = True
+                break
+
+            with Tracer.span('test', **self.trace_args, group=group_index, test=test_index):
+                res = self.run_cms(run_args, fileid, tests['in'], tests['ans'], tests['timelimit'], tests['memlimit'])
+            stdout_fileid = res["fileIds"]["stdout"]
+
+            if checking is not None:
+                checking.join()
+
+            if result['status'] is not None and self.group_failed(group_index):
+                # test N failed, the speculative run of test N + 1 is discarded
+                if not FileStoreCollector.delete(self.chal_id, stdout_fileid):
+                    utils.logger.warning(f"StdChal {self.chal_id} delete cached stdout file {stdout_fileid} failed.")
+                return
+
+            if res['status'] != GoJudgeStatus.Accepted:
+                # the run already failed, its output needs no checker and no further test is started
+                if not FileStoreCollector.delete(self.chal_id, stdout_fileid):
+                    utils.logger.warning(f"StdChal {self.chal_id} delete cached stdout file {stdout_fileid} failed.")
+                self.update_cms_result(res, result, None)
+                checking = None
+                break
+
+            checking = threading.Thread(target=self.check_cms_traced, args=(group_index, test_index, res, result, checker_fileid, stdout_fileid, tests['in'], tests['ans'], tests['timelimit'], tests['memlimit']))
+            checking.start()
+
+        if checking is not None:
+            checking.join()
+
+        if result['status'] is not None and self.group_failed(group_index):
+            return
+
+        if stopped:
+            self.group_skipped(group_index)
+
+    def check_cms_traced(self, group_index, test_index, res, result, checker_fileid, stdout_fileid, in_path, ans_path, timelimit, memlimit):
+        with Tracer.span('test_check', **self.trace_args, group=group_index, test=test_index):
+            self.check_cms_cached(res, result, checker_fileid, stdout_fileid, in_path, ans_path, timelimit, memlimit)
+
     def judge_diff_group_for_java(self, group_index, class_name, test_groups, fileid, run_args):
-        for tests in test_groups:
-            self.judge_diff_4_java(run_args, class_name, group_index, fileid, tests['in'], tests['ans'], tests['timelimit'], tests['memlimit'])
-            if self.results[group_index]['status'] != Status.Accepted:
+        for test_index, tests in enumerate(test_groups):
+            if self.group_skipped(group_index):
+                break
+
+            with Tracer.span('test', **self.trace_args, group=group_index, test=test_index):
+                self.judge_diff_4_java(run_args, class_name, group_index, fileid, tests['in'], tests['ans'], tests['timelimit'], tests['memlimit'])
+            if self.group_failed(group_index):
                 break
 
     def judge_diff_4_java(self, args, class_name, test_groups, fileid, in_path, ans_path, timelimit, memlimit):
@@ -203,7 +524,7 @@ class StdChal:
             return
 
 
-        res = executor_server.exec({
+        cmd = {
             "cmd": [{
                 "args": [*args],
                 "env": ["PATH=/usr/bin:/bin"],
@@ -211,7 +532,7 @@ class StdChal:
                     "src": in_path
                 }, {
                     "name": "stdout",
-                    "max": 268435456
+                    "max": self.output_limit(ans_path)
                 }, {
                     "name": "stderr",
                     "max": 10240,
@@ -227,18 +548,20 @@ class StdChal:
                 },
                 "copyOut": ["stdout"]
             }]
-        })
+        }
+        res = executor_server.exec(cmd, pin='run')
         res = res["results"][0]
+        res = self.remeasure(cmd, res, timelimit)
         result['time'] = max(res['runTime'], result['time'])
         result['memory'] = max(res['memory'], result['memory'])
 
         if res['status'] == GoJudgeStatus.Accepted:
             if result['status'] is Status.Accepted or result['status'] is None:
-                with open(ans_path, 'r') as ans_file:
+                with Tracer.span('diff'):
                     if self.judge_typ == "diff":
-                        res_pass = executor_server.diff_ignore_space(res['files']['stdout'], ans_file.read())
+                        res_pass = executor_server.diff_ignore_space(res['files']['stdout'], self.read_answer(ans_path))
                     elif self.judge_typ == "diff-strict":
-                        res_pass = executor_server.diff_strictly(res['files']['stdout'], ans_file.read())
+                        res_pass = executor_server.diff_strictly(res['files']['stdout'], self.read_answer(ans_path))
 
                     if res_pass:
                         result['status'] = Status.Accepted
@@ -269,7 +592,7 @@ class StdChal:
         if result["status"] in [Status.TimeLimitExceeded, Status.MemoryLimitExceeded, Status.RuntimeError, Status.RuntimeErrorSignalled, Status.InternalError]:
             return
 
-        res = executor_server.exec({
+        cmd = {
             "cmd": [{
                 "args": [*args],
                 "env": ["PATH=/usr/bin:/bin"],
@@ -277,7 +600,7 @@ class StdChal:
                     "src": in_path
                 }, {
                     "name": "stdout",
-                    "max": 268435456
+                    "max": self.output_limit(ans_path)
                 }, {
                     "name": "stderr",
                     "max": 10240,
@@ -295,18 +618,20 @@ class StdChal:
                 },
                 "copyOut": ["stdout"]
             }]
-        })
+        }
+        res = executor_server.exec(cmd, pin='run')
         res = res["results"][0]
+        res = self.remeasure(cmd, res, timelimit)
         result['time'] = max(res['runTime'], result['time'])
         result['memory'] = max(res['memory'], result['memory'])
 
         if res['status'] == GoJudgeStatus.Accepted:
             if result['status'] is Status.Accepted or result['status'] is None:
-                with open(ans_path, 'r') as ans_file:
+                with Tracer.span('diff'):
                     if self.judge_typ == "diff":
-                        res_pass = executor_server.diff_ignore_space(res['files']['stdout'], ans_file.read())
+                        res_pass = executor_server.diff_ignore_space(res['files']['stdout'], self.read_answer(ans_path))
                     elif self.judge_typ == "diff-strict":
-                        res_pass = res['files']['stdout'] == ans_file.read()
+                        res_pass = res['files']['stdout'] == self.read_answer(ans_path)
 
                     if res_pass:
                         result['status'] = Status.Accepted
@@ -335,11 +660,57 @@ class StdChal:
             else:
                 result['status'] = Status.InternalError
 
+    def remeasure(self, cmd, res, timelimit):
+        # Re-run a borderline run a few times and keep the fastest (or median) sample
+        near_limit = res['status'] == GoJudgeStatus.TimeLimitExceeded or \
+            (res['status'] == GoJudgeStatus.Accepted and res['runTime'] >= timelimit * (1 - config.REMEASURE_MARGIN))
+        if config.REMEASURE_SAMPLES <= 1 or not near_limit:
+            return res
+
+        samples = [res]
+        while len(samples) < config.REMEASURE_SAMPLES:
+            with self.lock:
+                if self.remeasure_budget <= 0:
+                    break
+                self.remeasure_budget -= 1
+
+            with Tracer.span('remeasure'):
+                samples.append(executor_server.exec(cmd, pin='run')["results"][0])
+
+        if len(samples) == 1:
+            return res
+
+        samples.sort(key=lambda sample: sample['runTime'])
+        if config.REMEASURE_POLICY == 'median':
+            chosen = samples[len(samples) // 2]
+        else:
+            chosen = samples[0]
+
+        with StdChal.stats_lock:
+            StdChal.remeasure_count += 1
+            if chosen['status'] != res['status']:
+                StdChal.remeasure_changed += 1
+
+        utils.logger.debug(f"StdChal {self.chal_id} remeasured {[sample['runTime'] for sample in samples]} {res['status']} -> {chosen['status']}")
+        return chosen
+
+    @staticmethod
+    def stats() -> dict:
+        return {
+            'remeasure_count': StdChal.remeasure_count,
+            'remeasure_changed': StdChal.remeasure_changed,
+        }
+
     def judge_diff_cms(self, args, test_groups, fileid, checker_fileid, in_path, ans_path, timelimit, memlimit):
         result = self.results[test_groups]
         if result["status"] in [Status.TimeLimitExceeded, Status.MemoryLimitExceeded, Status.RuntimeError, Status.RuntimeErrorSignalled, Status.InternalError]:
             return
 
+        res = self.run_cms(args, fileid, in_path, ans_path, timelimit, memlimit)
+        stdout_fileid = res["fileIds"]["stdout"]
+        self.check_cms_cached(res, result, checker_fileid, stdout_fileid, in_path, ans_path, timelimit, memlimit)
+
+    def run_cms(self, args, fileid, in_path, ans_path, timelimit, memlimit):
         res = executor_server.exec({
             "cmd": [{
                 "args": [*args],
@@ -348,7 +719,7 @@ class StdChal:
                     "src": in_path
                 }, {
                     "name": "stdout",
-                    "max": 268435456
+                    "max": self.output_limit(ans_path)
                 }, {
                     "name": "stderr",
                     "max": 10240,
@@ -366,48 +737,26 @@ class StdChal:
                 },
                 "copyOutCached": ["stdout"]
             }]
-        })
+        }, pin='run')
         res = res["results"][0]
-        stdout_fileid = res["fileIds"]["stdout"]
+        FileStoreCollector.track(self.chal_id, res["fileIds"]["stdout"])
+        return res
 
-        checker_res = executor_server.exec({
-            "cmd": [{
-                "args": ["check", "test_in", "test_out", "user_ans"],
-                "env": ["PATH=/usr/bin:/bin"],
-                "files": [{
-                    "content": ""
-                }, {
-                    "name": "stdout",
-                    "max": 10240
-                }, {
-                    "name": "stderr",
-                    "max": 10240,
-                }],
-                "cpuLimit": timelimit * 2,
-                "memoryLimit": memlimit,
-                "stackLimit": 65536 * 1024,
-                "procLimit": 10,
-                "cpuRateLimit": 1000,
-                "strictMemoryLimit": False, # 開了會直接Signalled，會讓使用者沒辦法判斷
-                "copyIn": {
-                    "check": {
-                        "fileId": checker_fileid
-                    },
-                    "test_in": {
-                        "src": in_path
-                    },
-                    "test_out": {
-                        "src": ans_path
-                    },
-                    "user_ans": {
-                        "fileId": stdout_fileid
-                    }
-                },
-                "copyOut": ["stdout", "stderr"]
-            }]
-        })
-        checker_res = checker_res["results"][0]
+    def check_cms_cached(self, res, result, checker_fileid, stdout_fileid, in_path, ans_path, timelimit, memlimit):
+        # The cached stdout is released as soon as its checker has finished
+        try:
+            self.check_cms(res, result, checker_fileid, stdout_fileid, in_path, ans_path, timelimit, memlimit)
+        finally:
+            if not FileStoreCollector.delete(self.chal_id, stdout_fileid):
+                utils.logger.warning(f"StdChal {self.chal_id} delete cached stdout file {stdout_fileid} failed.")
+
+    def check_cms(self, res, result, checker_fileid, stdout_fileid, in_path, ans_path, timelimit, memlimit):
+        with Tracer.span('checker'):
+            checker_res = self.exec_cms_checker(checker_fileid, stdout_fileid, in_path, ans_path, timelimit, memlimit)
 
+        self.update_cms_result(res, result, checker_res)
+
+    def update_cms_result(self, res, result, checker_res):
         result['time'] = max(res['runTime'], result['time'])
         result['memory'] = max(res['memory'], result['memory'])
 
@@ -468,9 +817,44 @@ class StdChal:
             else:
                 result['status'] = Status.InternalError
 
-        if executor_server.file_delete(stdout_fileid) == 0:
-            utils.logger.warning(f"StdChal {self.chal_id} delete cached stdout file {stdout_fileid} failed.")
-
+    def exec_cms_checker(self, checker_fileid, stdout_fileid, in_path, ans_path, timelimit, memlimit):
+        res = executor_server.exec({
+            "cmd": [{
+                "args": ["check", "test_in", "test_out", "user_ans"],
+                "env": ["PATH=/usr/bin:/bin"],
+                "files": [{
+                    "content": ""
+                }, {
+                    "name": "stdout",
+                    "max": 10240
+                }, {
+                    "name": "stderr",
+                    "max": 10240,
+                }],
+                "cpuLimit": timelimit * 2,
+                "memoryLimit": memlimit,
+                "stackLimit": 65536 * 1024,
+                "procLimit": 10,
+                "cpuRateLimit": 1000,
+                "strictMemoryLimit": False, # 開了會直接Signalled，會讓使用者沒辦法判斷
+                "copyIn": {
+                    "check": {
+                        "fileId": checker_fileid
+                    },
+                    "test_in": {
+                        "src": in_path
+                    },
+                    "test_out": {
+                        "src": ans_path
+                    },
+                    "user_ans": {
+                        "fileId": stdout_fileid
+                    }
+                },
+                "copyOut": ["stdout", "stderr"]
+            }]
+        }, pin='check')
+        return res["results"][0]
 
     def judge_diff_ioredir(self, args, test_groups, fileid, checker_fileid, in_path, ans_path, timelimit, memlimit):
         result = self.results[test_groups]
@@ -523,10 +907,13 @@ class StdChal:
         except KeyError:
             pass
 
+        # 'direct' skips go-judge's proxy copy between the program and the checker,
+        # both sides then get a wall clock limit so a blocked interaction cannot hang the slot
+        direct = self.metadata.get('redir_pipe', 'proxy') == 'direct'
         pipe_mappings.append({
             "in": {"index": 0, "fd": self.metadata["redir_test"]["pipeout"]},
             "out": {"index": 1, "fd": self.metadata["redir_check"]["pipeout"]},
-            "proxy": True,
+            "proxy": not direct,
         })
 
         if self.metadata["redir_test"]["pipein"] != -1 and self.metadata["redir_check"]["pipein"] != -1:
@@ -535,7 +922,7 @@ class StdChal:
                 "out": {"index": 0, "fd": self.metadata["redir_test"]["pipein"]},
             })
 
-        res = executor_server.exec({
+        cmd = {
             "cmd": [{
                 "args": [*args],
                 "env": ["PATH=/usr/bin:/bin"],
@@ -556,8 +943,8 @@ class StdChal:
                 "args": ['check'],
                 "env": ["PATH=/usr/bin:/bin"],
                 "files": list(checker_files.values()),
-                "cpuLimit": timelimit, # 5 sec
-                "memoryLimit": 536870912, # 512M (256 << 20)
+                "cpuLimit": self.metadata.get('checker_timelimit', timelimit // 10 ** 6) * 10 ** 6, # 5 sec
+                "memoryLimit": self.metadata.get('checker_memlimit', 536870912), # 512M (256 << 20)
                 "procLimit": 10,
                 "strictMemoryLimit": False, # 開了會直接Signalled，會讓使用者沒辦法判斷
                 "copyIn": {
@@ -567,7 +954,12 @@ class StdChal:
                 },
             }],
             "pipeMapping": pipe_mappings,
-        })
+        }
+        if direct:
+            for c in cmd["cmd"]:
+                c["clockLimit"] = c["cpuLimit"] * config.IOREDIR_CLOCK_FACTOR
+
+        res = executor_server.exec(cmd, pin='run')
         checker_res = res["results"][1]
         res = res["results"][0]
         result['time'] = max(res['runTime'], result['time'])
@@ -644,7 +1036,7 @@ class StdChal:
                 "copyOut": ["stderr"],
                 "copyOutCached": ["check"]
             }]
-        })
+        }, pin='compile')
         res = res["results"][0]
         return self.compile_update_result(res, "check")
 
@@ -652,15 +1044,13 @@ class StdChal:
         if self.comp_typ == 'g++':
             compiler = '/usr/bin/g++'
             standard = '-std=gnu++17'
-            options = ['-O2']
         else:
             compiler = '/usr/bin/clang++'
             standard = '-std=c++17'
-            options = ['-O2']
 
         res = executor_server.exec({
             "cmd": [{
-                "args": [compiler, standard, *options, "-pipe", "-static", "a.cpp", "-o", "a"],
+                "args": [compiler, standard, *self.compile_flags[self.comp_typ], "a.cpp", "-o", "a"],
                 "env": ["PATH=/usr/bin:/bin"],
                 "files": [{
                     "content": ""
@@ -682,7 +1072,7 @@ class StdChal:
                 "copyOutCached": ["a"],
                 "copyOutMax": 64000000
             }]
-        })
+        }, pin='compile')
         res = res["results"][0]
         return self.compile_update_result(res, "a")
 
@@ -696,7 +1086,7 @@ class StdChal:
 
         res = executor_server.exec({
             "cmd": [{
-                "args": [compiler, standard, "-O2", "-pipe", "-static", "a.c", "-o", "a", "-lm"],
+                "args": [compiler, standard, *self.compile_flags[self.comp_typ], "a.c", "-o", "a", "-lm"],
                 "env": ["PATH=/usr/bin:/bin"],
                 "files": [{
                     "content": ""
@@ -718,14 +1108,14 @@ class StdChal:
                 "copyOutCached": ["a"],
                 "copyOutMax": 64000000
             }]
-        })
+        }, pin='compile')
         res = res["results"][0]
         return self.compile_update_result(res, "a")
 
     def comp_rustc(self):
         res = executor_server.exec({
             "cmd": [{
-                "args": ["/usr/bin/rustc", "./a.rs", "-O", "-o", "a"],
+                "args": ["/usr/bin/rustc", "./a.rs", *self.compile_flags[self.comp_typ], "-o", "a"],
                 "env": ["PATH=/usr/bin:/bin"],
                 "files": [{
                     "content": ""
@@ -747,7 +1137,7 @@ class StdChal:
                 "copyOutCached": ["a"],
                 "copyOutMax": 64000000
             }]
-        })
+        }, pin='compile')
         res = res["results"][0]
         return self.compile_update_result(res, "a")
 
@@ -776,7 +1166,7 @@ class StdChal:
                 "copyOutCached": ["a.pyc"],
                 "copyOutMax": 64000000
             }]
-        })
+        }, pin='compile')
         res = res["results"][0]
         return self.compile_update_result(res, "a.pyc")
 
@@ -815,7 +1205,7 @@ class StdChal:
                 "copyOutCached": [f"{main_class_name}.class"],
                 "copyOutMax": 64000000
             }]
-        })
+        }, pin='compile')
         res = res["results"][0]
 
         # Java Output maybe in stdout or stderr
@@ -861,12 +1251,39 @@ class StdChal:
                 "copyOutCached": ["a"],
                 "copyOutMax": 64000000
             }]
-        })
+        }, pin='compile')
         res = res["results"][0]
         return self.compile_update_result(res, "a")
 
+    def compile(self):
+        class_name = None
+        if self.comp_typ in ['g++', 'clang++']:
+            res, fileid = self.comp_cxx()
+
+        elif self.comp_typ in ['gcc', 'clang']:
+            res, fileid = self.comp_c()
+
+        elif self.comp_typ == 'makefile':
+            res, fileid = self.comp_make()
+
+        elif self.comp_typ == 'python3':
+            res, fileid = self.comp_python()
+
+        elif self.comp_typ == 'rustc':
+            res, fileid = self.comp_rustc()
+
+        elif self.comp_typ == 'java':
+            t, class_name = self.comp_java()
+            res, fileid = t
+        else:
+            return None, None, None
+
+        return res, fileid, class_name
+
     def compile_update_result(self, res, copy_out_name):
+        self.compile_usage = (res.get("time", 0), res.get("runTime", 0), res.get("memory", 0))
         if res["status"] == GoJudgeStatus.Accepted:
+            FileStoreCollector.track(self.chal_id, res["fileIds"][copy_out_name])
             return res["status"], res["fileIds"][copy_out_name]
 
         elif res["status"] == GoJudgeStatus.NonzeroExitStatus:
@@ -0,0 +1,76 @@
+import collections
+import contextlib
+import os
+import threading
+import time
+
+import config
+
+
+class Tracer:
+    # (name, start_ns, end_ns, thread ident, args)
+    events = collections.deque(maxlen=config.TRACE_BUFFER_SIZE)
+    local = threading.local()
+    origin = time.monotonic_ns()
+
+    # args inherited by nested spans on the same thread
+    INHERITED_ARGS = ['chal_id', 'slot', 'group', 'test']
+
+    @staticmethod
+    @contextlib.contextmanager
+    def span(name, **args):
+        if not config.TRACE_ENABLED:
+            yield {}
+            return
+
+        stack = getattr(Tracer.local, 'stack', None)
+        if stack is None:
+            stack = Tracer.local.stack = []
+
+        if stack:
+            parent = stack[-1]
+            args = {**{k: parent[k] for k in Tracer.INHERITED_ARGS if k in parent}, **args}
+
+        stack.append(args)
+        start = time.monotonic_ns()
+        try:
+            yield args
+        finally:
+            stack.pop()
+            Tracer.events.append((name, start, time.monotonic_ns(), threading.get_ident(), args))
+
+    @staticmethod
+    def current() -> dict:
+        stack = getattr(Tracer.local, 'stack', None)
+        if not stack:
+            return {}
+
+        return {k: stack[-1][k] for k in Tracer.INHERITED_ARGS if k in stack[-1]}
+
+    @staticmethod
+    def record(name, start, end, **args):
+        if not config.TRACE_ENABLED:
+            return
+
+        Tracer.events.append((name, start, end, threading.get_ident(), args))
+
+    @staticmethod
+    def export() -> dict:
+        pid = os.getpid()
+        trace_events = []
+        for name, start, end, tid, args in list(Tracer.events):
+            trace_events.append({
+                'name': name,
+                'cat': 'judge',
+                'ph': 'X',
+                'ts': (start - Tracer.origin) / 1000,
+                'dur': (end - start) / 1000,
+                'pid': pid,
+                'tid': tid,
+                'args': args,
+            })
+
+        return {
+            'traceEvents': trace_events,
+            'displayTimeUnit': 'ms',
+        }
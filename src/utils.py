@@ -1,3 +1,4 @@
+import os
 import re
 import logging
 
@@ -30,3 +31,18 @@ def get_java_main_class(source: str) -> str:
         return main_class_name
 
     return ""
+
+def fadvise_willneed(path: str) -> int:
+    # Ask the kernel to read the file into the page cache, returns the file size
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return 0
+
+    try:
+        size = os.fstat(fd).st_size
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+    finally:
+        os.close(fd)
+
+    return size
@@ -0,0 +1,83 @@
+import os
+import tempfile
+import threading
+
+import config
+import utils
+from filestore import FileStoreCollector
+from stdchal import StdChal, Status
+
+
+WARMUP_SOURCES = {
+    'gcc': '#include <stdio.h>\nint main() { puts("ok"); return 0; }\n',
+    'clang': '#include <stdio.h>\nint main() { puts("ok"); return 0; }\n',
+    'g++': '#include <iostream>\nint main() { std::cout << "ok" << std::endl; return 0; }\n',
+    'clang++': '#include <iostream>\nint main() { std::cout << "ok" << std::endl; return 0; }\n',
+    'python3': 'print("ok")\n',
+    'rustc': 'fn main() {\n    println!("ok");\n}\n',
+    'java': 'public class Main {\n    public static void main(String[] args) {\n        System.out.println("ok");\n    }\n}\n',
+}
+
+class Warmup:
+    ready = False
+
+    @staticmethod
+    def warm_problem(res_path):
+        total = 0
+        for sub in ['testdata', 'check', 'make']:
+            dir_path = os.path.join(res_path, sub)
+            if not os.path.isdir(dir_path):
+                continue
+
+            for file in os.listdir(dir_path):
+                total += utils.fadvise_willneed(os.path.join(dir_path, file))
+
+        utils.logger.info(f"Warmup preloaded {res_path} {total} bytes")
+
+    @staticmethod
+    def warm_language(comp_typ, tmp_dir):
+        code_path = os.path.join(tmp_dir, f"{comp_typ}.src")
+        with open(code_path, 'w') as code_file:
+            code_file.write(WARMUP_SOURCES[comp_typ])
+
+        chal_id = f"warmup-{comp_typ}"
+        test_list = [[{
+            'in': os.path.join(tmp_dir, 'warmup.in'),
+            'ans': os.path.join(tmp_dir, 'warmup.out'),
+            'timelimit': 10 ** 9,
+            'memlimit': 268435456,
+        }]]
+        chal = StdChal(chal_id, code_path, comp_typ, 'diff', tmp_dir, test_list, {})
+        try:
+            results = chal.start()
+        finally:
+            FileStoreCollector.release_chal(chal_id)
+
+        if results[0]['status'] != Status.Accepted:
+            utils.logger.warning(f"Warmup {comp_typ} failed with status {results[0]['status']}")
+        else:
+            utils.logger.info(f"Warmup {comp_typ} done")
+
+    @staticmethod
+    def run():
+        utils.logger.info("Warmup started")
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            with open(os.path.join(tmp_dir, 'warmup.in'), 'w') as in_file:
+                in_file.write('')
+            with open(os.path.join(tmp_dir, 'warmup.out'), 'w') as ans_file:
+                ans_file.write('ok\n')
+
+            tasks = []
+            for comp_typ in WARMUP_SOURCES:
+                t = threading.Thread(target=Warmup.warm_language, args=(comp_typ, tmp_dir))
+                t.start()
+                tasks.append(t)
+
+            for res_path in config.WARMUP_PROBLEMS:
+                Warmup.warm_problem(res_path)
+
+            for task in tasks:
+                task.join()
+
+        Warmup.ready = True
+        utils.logger.info("Warmup finished, judge ready")